@@ -10,7 +10,9 @@ import uuid
 import urllib
 import json
 import glob
+import shutil
 import struct
+import tarfile
 import ssl
 import socket
 import ipaddress
@@ -145,6 +147,40 @@ def create_origin_only_middleware():
 
     return origin_only_middleware
 
+PAINT3D_INPUT_DIR = "/root/ComfyUI/input/3d"
+PAINT3D_JOBS_DIR = os.path.join(PAINT3D_INPUT_DIR, "jobs")
+
+def get_job_dir(prompt_id):
+    """Job-scoped working directory, or None if prompt_id is not a plain uuid"""
+    try:
+        prompt_id = str(uuid.UUID(prompt_id))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return os.path.join(PAINT3D_JOBS_DIR, prompt_id)
+
+def stage_job_meshes(prompt):
+    """Copy the template mesh of every 3D_TrainConfig pointing into a job directory.
+
+    The Paint3D nodes write their outputs into a `Paint3D` directory next to the
+    input mesh, so giving each job its own copy of the mesh isolates its outputs.
+    """
+    for node in prompt.values():
+        if not isinstance(node, dict) or node.get("class_type") != "3D_TrainConfig":
+            continue
+        mesh_path = node.get("inputs", {}).get("mesh_file_path")
+        if not isinstance(mesh_path, str):
+            continue
+        mesh_path = os.path.abspath(mesh_path)
+        job_dir = os.path.dirname(mesh_path)
+        if os.path.dirname(job_dir) != PAINT3D_JOBS_DIR or os.path.exists(mesh_path):
+            continue
+
+        os.makedirs(job_dir, exist_ok=True)
+        mesh_name = os.path.splitext(os.path.basename(mesh_path))[0]
+        for template in glob.glob(os.path.join(PAINT3D_INPUT_DIR, glob.escape(mesh_name) + ".*")):
+            if os.path.isfile(template):
+                shutil.copy(template, job_dir)
+
 class PromptServer():
     def __init__(self, loop):
         PromptServer.instance = self
@@ -176,6 +212,8 @@ class PromptServer():
         max_upload_size = round(args.max_upload_size * 1024 * 1024)
         self.app = web.Application(client_max_size=max_upload_size, middlewares=middlewares)
         self.sockets = dict()
+        # Clients that connected with ?previews=0 and never get preview images
+        self.preview_opt_out = set()
         self.web_root = (
             FrontendManager.init_frontend(args.front_end_version)
             if args.front_end_root is None
@@ -201,6 +239,11 @@ class PromptServer():
                 sid = uuid.uuid4().hex
 
             self.sockets[sid] = ws
+            # Headless API clients skip preview encoding with ?previews=0
+            if request.rel_url.query.get('previews', '1') == '0':
+                self.preview_opt_out.add(sid)
+            else:
+                self.preview_opt_out.discard(sid)
 
             try:
                 # Send initial state to the new client
@@ -214,6 +257,7 @@ class PromptServer():
                         logging.warning('ws connection closed with exception %s' % ws.exception())
             finally:
                 self.sockets.pop(sid, None)
+                self.preview_opt_out.discard(sid)
             return ws
 
         @routes.get("/")
@@ -255,6 +299,84 @@ class PromptServer():
                 headers=headers
             )
 
+        # Registered before the per-file route, which would match "bundle" too
+        @routes.get("/download/{prompt_id}/bundle")
+        async def download_paint3d_bundle(request):
+            prompt_id = request.match_info.get("prompt_id", "")
+            job_dir = get_job_dir(prompt_id)
+            if job_dir is None:
+                return web.Response(status=400, text="Valid prompt id is required")
+
+            output_dir = os.path.join(job_dir, "Paint3D")
+            if not os.path.isdir(output_dir):
+                return web.Response(status=404, text="Job outputs not found")
+
+            # Bundle the requested files, or every file of the job
+            names = request.rel_url.query.get("files", "")
+            if names:
+                filenames = names.split(",")
+            else:
+                filenames = sorted(f for f in os.listdir(output_dir) if os.path.isfile(os.path.join(output_dir, f)))
+
+            for filename in filenames:
+                file_path = os.path.join(output_dir, filename)
+                # Security check: Ensure the file path is within the job output directory
+                if not filename or not os.path.commonpath([os.path.abspath(file_path), output_dir]) == output_dir:
+                    return web.Response(status=403, text="Access denied")
+                if not os.path.isfile(file_path):
+                    return web.Response(status=404, text=f"File not found: {filename}")
+
+            def build_bundle():
+                # Uncompressed: the PNG is already compressed and the archive
+                # only crosses the local network
+                buffer = BytesIO()
+                with tarfile.open(fileobj=buffer, mode="w") as tar:
+                    for filename in filenames:
+                        tar.add(os.path.join(output_dir, filename), arcname=filename)
+                return buffer.getvalue()
+
+            body = await asyncio.get_running_loop().run_in_executor(None, build_bundle)
+            headers = {"Content-Disposition": f"attachment; filename=\"{prompt_id}.tar\""}
+            return web.Response(body=body, content_type="application/x-tar", headers=headers)
+
+        @routes.get("/download/{prompt_id}/{filename}")
+        async def download_paint3d_job(request):
+            job_dir = get_job_dir(request.match_info.get("prompt_id", ""))
+            filename = request.match_info.get("filename", "")
+
+            if job_dir is None or not filename:
+                return web.Response(status=400, text="Valid prompt id and filename are required")
+
+            output_dir = os.path.join(job_dir, "Paint3D")
+            file_path = os.path.join(output_dir, filename)
+
+            # Security check: Ensure the file path is within the job output directory
+            if not os.path.commonpath([os.path.abspath(file_path), output_dir]) == output_dir:
+                return web.Response(status=403, text="Access denied")
+
+            if not os.path.exists(file_path):
+                return web.Response(status=404, text="File not found")
+
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            headers = {
+                "Content-Disposition": f"attachment; filename=\"{filename}\"",
+                "Content-Type": content_type
+            }
+
+            return web.FileResponse(
+                path=file_path,
+                headers=headers
+            )
+
+        @routes.delete("/download/{prompt_id}")
+        async def delete_paint3d_job(request):
+            job_dir = get_job_dir(request.match_info.get("prompt_id", ""))
+            if job_dir is None:
+                return web.Response(status=400, text="Valid prompt id is required")
+
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return web.Response(status=200)
+
         @routes.get("/embeddings")
         def get_embeddings(self):
             embeddings = folder_paths.get_filename_list("embeddings")
@@ -671,6 +793,7 @@ class PromptServer():
 
             if "prompt" in json_data:
                 prompt = json_data["prompt"]
+                stage_job_meshes(prompt)
                 valid = execution.validate_prompt(prompt)
                 extra_data = {}
                 if "extra_data" in json_data:
@@ -680,6 +803,11 @@ class PromptServer():
                     extra_data["client_id"] = json_data["client_id"]
                 if valid[0]:
                     prompt_id = str(uuid.uuid4())
+                    if "prompt_id" in json_data:
+                        job_dir = get_job_dir(json_data["prompt_id"])
+                        if job_dir is None:
+                            return web.json_response({"error": "invalid prompt_id", "node_errors": []}, status=400)
+                        prompt_id = os.path.basename(job_dir)
                     outputs_to_execute = valid[2]
                     self.prompt_queue.put((number, prompt_id, prompt, extra_data, outputs_to_execute))
                     response = {"prompt_id": prompt_id, "number": number, "node_errors": valid[3]}
@@ -772,7 +900,16 @@ class PromptServer():
         prompt_info['exec_info'] = exec_info
         return prompt_info
 
+    def wants_previews(self, sid):
+        if sid is None:
+            return any(s not in self.preview_opt_out for s in self.sockets)
+        return sid in self.sockets and sid not in self.preview_opt_out
+
     async def send(self, event, data, sid=None):
+        if event in (BinaryEventTypes.PREVIEW_IMAGE, BinaryEventTypes.UNENCODED_PREVIEW_IMAGE):
+            # Don't resize and encode previews nobody is going to look at
+            if not self.wants_previews(sid):
+                return
         if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE:
             await self.send_image(data, sid=sid)
         elif isinstance(data, (bytes, bytearray)):
@@ -817,7 +954,10 @@ class PromptServer():
         message = self.encode_bytes(event, data)
 
         if sid is None:
-            sockets = list(self.sockets.values())
+            sockets = [
+                ws for s, ws in list(self.sockets.items())
+                if event != BinaryEventTypes.PREVIEW_IMAGE or s not in self.preview_opt_out
+            ]
             for ws in sockets:
                 await send_socket_catch_exception(ws.send_bytes, message)
         elif sid in self.sockets:
@@ -1,6 +1,7 @@
 import base64
+import json
 import os
-from time import sleep
+import time
 
 import requests
 
@@ -42,67 +43,83 @@ prompts = [
 output_dir = "benchmark_output"
 os.makedirs(output_dir, exist_ok=True)
 
-# API endpoint
-api_url = "http://localhost:5000/api/texture"
+# API endpoints
+api_url = "http://localhost:5000/api/texture/batch"
+queue_url = "http://localhost:5000/api/queue"
 
 
-def process_prompt(prompt):
+def safe_filename(prompt):
     # Create a safe filename from the prompt
-    safe_filename = "".join(
+    filename = "".join(
         x for x in prompt if x.isalnum() or x in (" ", "-", "_")
     ).rstrip()
-    safe_filename = safe_filename.replace(" ", "_")
+    return filename.replace(" ", "_")
 
-    # Prepare the request
-    payload = {"user_prompt": prompt}
-    headers = {"Content-Type": "application/json"}
 
-    print(f"Processing prompt: {prompt}")
+def save_result(result):
+    prompt = result["user_prompt"]
 
-    try:
-        # Make the request
-        response = requests.post(api_url, json=payload, headers=headers)
-        response.raise_for_status()
+    if result.get("status") == "success":
+        # Decode the base64 GLB data
+        glb_data = base64.b64decode(result["glb_data"])
 
-        # Parse the response
-        result = response.json()
+        # Save the GLB file
+        output_path = os.path.join(output_dir, f"{safe_filename(prompt)}.glb")
+        with open(output_path, "wb") as f:
+            f.write(glb_data)
 
-        if result.get("status") == "success":
-            # Decode the base64 GLB data
-            glb_data = base64.b64decode(result["glb_data"])
+        print(f"Successfully saved: {output_path}")
+        return True
+    else:
+        print(
+            f"Error for prompt '{prompt}': {result.get('error', 'Unknown error')}"
+        )
+        return False
 
-            # Save the GLB file
-            output_path = os.path.join(output_dir, f"{safe_filename}.glb")
-            with open(output_path, "wb") as f:
-                f.write(glb_data)
 
-            print(f"Successfully saved: {output_path}")
-            return True
-        else:
-            print(f"Error in response: {result.get('error', 'Unknown error')}")
-            return False
+def batch_size():
+    # Largest batch the server's admission queue can hold
+    stats = requests.get(queue_url).json()
+    return stats["max_in_flight"] + stats["max_queued"]
 
-    except requests.exceptions.RequestException as e:
-        print(f"Request failed for prompt '{prompt}': {str(e)}")
-        return False
-    except Exception as e:
-        print(f"Error processing prompt '{prompt}': {str(e)}")
-        return False
+
+def run_batch(batch):
+    """Submit one batch and save its results as they stream back"""
+    payload = {"prompts": batch, "priority": "batch"}
+    headers = {"Content-Type": "application/json"}
+    print(f"Submitting {len(batch)} prompts...")
+
+    while True:
+        with requests.post(
+            api_url, json=payload, headers=headers, stream=True
+        ) as response:
+            if response.status_code != 429:
+                response.raise_for_status()
+                successful = 0
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    print("\n" + "=" * 50)
+                    if save_result(json.loads(line)):
+                        successful += 1
+                return successful
+            delay = int(response.headers.get("Retry-After", 5))
+
+        # Other requests fill the queue; try again once slots free up
+        print(f"Queue full, retrying in {delay} s")
+        time.sleep(delay)
 
 
 def main():
     successful = 0
-    failed = 0
-
-    for prompt in prompts:
-        print("\n" + "=" * 50)
-        if process_prompt(prompt):
-            successful += 1
-        else:
-            failed += 1
 
-        # Add a small delay between requests to prevent overwhelming the server
-        sleep(5)
+    try:
+        size = batch_size()
+        for start in range(0, len(prompts), size):
+            successful += run_batch(prompts[start : start + size])
+    except requests.exceptions.RequestException as e:
+        print(f"Batch request failed: {str(e)}")
+    failed = len(prompts) - successful
 
     print("\n" + "=" * 50)
     print("Processing complete!")
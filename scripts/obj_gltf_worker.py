@@ -0,0 +1,86 @@
+"""Persistent OBJ to GLB converter, run inside Blender by the wrapper's pool.
+
+    blender -b --factory-startup -P scripts/obj_gltf_worker.py
+
+Reads one JSON job per line on stdin (`{"obj_path": ..., "output_dir": ...}`)
+and answers each with a `TCP-RESULT {...}` line on stdout, resetting the scene
+between jobs so the Blender startup cost is only paid once.
+"""
+
+import json
+import os
+import sys
+import traceback
+
+import bpy
+
+RESULT_PREFIX = "TCP-RESULT "
+SCALE = 18
+
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+
+def import_obj(filepath):
+    try:
+        bpy.ops.wm.obj_import(filepath=filepath)
+    except AttributeError:
+        # Blender < 3.2 only ships the legacy importer
+        bpy.ops.import_scene.obj(filepath=filepath)
+
+    if not any(obj.type == "MESH" for obj in bpy.data.objects):
+        raise Exception(f"No objects were imported from {filepath}")
+
+
+def rescale_meshes():
+    for obj in bpy.data.objects:
+        if obj.type == "MESH":
+            original_location = obj.location.copy()
+
+            obj.scale.x *= SCALE
+            obj.scale.y *= SCALE
+            obj.scale.z *= SCALE
+
+            # Make the scale permanent while preserving the origin
+            bpy.ops.object.select_all(action="DESELECT")
+            bpy.context.view_layer.objects.active = obj
+            obj.select_set(True)
+            bpy.ops.object.transform_apply(
+                location=False, rotation=False, scale=True
+            )
+
+            obj.location = original_location
+
+
+def convert(obj_path, output_dir):
+    reset_scene()
+    import_obj(obj_path)
+    rescale_meshes()
+
+    basename = os.path.splitext(os.path.basename(obj_path))[0]
+    export_file = os.path.join(output_dir, basename + ".glb")
+    bpy.ops.export_scene.gltf(filepath=export_file, export_format="GLB")
+    return export_file
+
+
+def respond(result):
+    sys.stdout.write(RESULT_PREFIX + json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    respond({"status": "ready"})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            glb_path = convert(job["obj_path"], job["output_dir"])
+            respond({"status": "ok", "glb_path": glb_path})
+        except Exception as e:
+            traceback.print_exc()
+            respond({"status": "error", "error": str(e)})
+
+
+main()
@@ -1,4 +1,45 @@
+import argparse
+
+from src.app import serve
 from src.wrapper import Wrapper
 
-app: Wrapper = Wrapper()
-app.run()
+parser = argparse.ArgumentParser(description="TCP texturing API server")
+parser.add_argument("--host", default="0.0.0.0")
+parser.add_argument("--port", type=int, default=5000)
+parser.add_argument(
+    "--workers", type=int, default=1, help="number of worker processes"
+)
+parser.add_argument(
+    "--threads", type=int, default=8, help="request threads per worker"
+)
+parser.add_argument(
+    "--keepalive",
+    type=int,
+    default=5,
+    help="seconds to keep idle client connections open",
+)
+parser.add_argument(
+    "--graceful-timeout",
+    type=int,
+    default=300,
+    help="seconds to drain in-flight texture jobs on shutdown",
+)
+parser.add_argument(
+    "--dev",
+    action="store_true",
+    help="run the Flask development server instead",
+)
+args = parser.parse_args()
+
+if args.dev:
+    app: Wrapper = Wrapper()
+    app.run(host=args.host, port=args.port)
+else:
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        threads=args.threads,
+        keepalive=args.keepalive,
+        graceful_timeout=args.graceful_timeout,
+    )
@@ -0,0 +1,168 @@
+import itertools
+import math
+import threading
+import time
+
+# Seconds a lane's requests are ordered behind interactive ones. A batch
+# request admitted at t ranks like an interactive one admitted at t + 600,
+# so it can be overtaken for at most that long and never starves.
+PRIORITY_DELAYS = {"interactive": 0.0, "batch": 600.0}
+
+
+class Ticket:
+    """Admission granted to one request; entering it waits for a slot"""
+
+    def __init__(self, controller, rank):
+        self.controller = controller
+        # Lower ranks run first; also used as the ComfyUI queue number
+        self.rank = rank
+        self.admitted_at = time.monotonic()
+        self.started_at = None
+        self.closed = False
+
+    def __enter__(self):
+        self.controller._start(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.controller._finish(self, success=exc_info[0] is None)
+        return False
+
+    def cancel(self):
+        """Give the queue slot back without ever running"""
+        self.controller._cancel(self)
+
+
+class AdmissionController:
+    """Bounds in-flight and queued texture generations.
+
+    At most `max_in_flight` tickets run at once and `max_queued` more may
+    wait for a slot; beyond that `admit()` refuses. Free slots go to the
+    waiting ticket with the lowest rank (admission time plus the delay of
+    its priority lane). Wait estimates use a moving average of observed
+    generation durations.
+    """
+
+    def __init__(
+        self,
+        max_in_flight=4,
+        max_queued=16,
+        initial_duration=120.0,
+        priority_delays=None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.priority_delays = dict(priority_delays or PRIORITY_DELAYS)
+        self.average_duration = initial_duration
+        self.in_flight = 0
+        self.queued = 0
+        # Admitted tickets that have not started, and those among them
+        # already blocked waiting for a slot
+        self.pending = set()
+        self.waiters = set()
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    @property
+    def capacity(self):
+        """Most tickets that can be admitted at once"""
+        return self.max_in_flight + self.max_queued
+
+    def admit(self, priority="interactive"):
+        """Return a Ticket, or None when the queue is full"""
+        tickets = self.admit_many(1, priority)
+        return tickets[0] if tickets else None
+
+    def admit_many(self, count, priority="interactive"):
+        """Return `count` Tickets, or None unless they all fit the queue
+
+        The tickets share their admission time and rank in order.
+        """
+        with self.condition:
+            # `queued` counts admitted tickets that have not started yet
+            waiting = self.in_flight + self.queued - self.max_in_flight
+            if waiting + count > self.max_queued:
+                return None
+            self.queued += count
+            rank = time.time() + self.priority_delays[priority]
+            tickets = [
+                Ticket(self, (rank, next(self.sequence))) for _ in range(count)
+            ]
+            self.pending.update(tickets)
+            return tickets
+
+    def _start(self, ticket):
+        with self.condition:
+            if ticket.closed:
+                raise RuntimeError("Ticket was cancelled")
+            self.waiters.add(ticket)
+            while not self._can_start(ticket):
+                self.condition.wait()
+            self.waiters.discard(ticket)
+            self.pending.discard(ticket)
+            self.queued -= 1
+            self.in_flight += 1
+            ticket.started_at = time.monotonic()
+            # Another slot may still be free for the next waiter
+            self.condition.notify_all()
+
+    def _can_start(self, ticket):
+        if self.in_flight >= self.max_in_flight:
+            return False
+        return ticket.rank == min(waiter.rank for waiter in self.waiters)
+
+    def _finish(self, ticket, success):
+        with self.condition:
+            self.in_flight -= 1
+            ticket.closed = True
+            # Failures are usually fast and would skew the estimate
+            if success:
+                duration = time.monotonic() - ticket.started_at
+                self.average_duration += 0.2 * (
+                    duration - self.average_duration
+                )
+            self.condition.notify_all()
+
+    def _cancel(self, ticket):
+        with self.condition:
+            # A ticket already waiting for its slot will run
+            if (
+                ticket.started_at is None
+                and not ticket.closed
+                and ticket not in self.waiters
+            ):
+                ticket.closed = True
+                self.pending.discard(ticket)
+                self.queued -= 1
+
+    def position(self, ticket):
+        """Number of queued tickets ahead of `ticket`, or None once started"""
+        with self.condition:
+            if ticket not in self.pending:
+                return None
+            return sum(other.rank < ticket.rank for other in self.pending)
+
+    def estimated_wait(self):
+        """Seconds a request admitted now would wait before starting"""
+        with self.condition:
+            waiting = self.in_flight + self.queued - self.max_in_flight + 1
+            if waiting <= 0:
+                return 0.0
+            return self.average_duration * waiting / self.max_in_flight
+
+    def retry_after(self):
+        """Seconds until a queue slot is expected to free up"""
+        with self.condition:
+            return max(1, math.ceil(self.average_duration / self.max_in_flight))
+
+    def stats(self):
+        with self.condition:
+            stats = {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queued": self.max_queued,
+                "average_duration": round(self.average_duration, 3),
+            }
+        stats["estimated_wait"] = round(self.estimated_wait(), 3)
+        return stats
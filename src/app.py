@@ -0,0 +1,61 @@
+from flask import Flask
+
+from src.wrapper import Wrapper
+
+
+def create_app(**options) -> Flask:
+    """WSGI application factory, e.g. `gunicorn "src.app:create_app()"`
+
+    Keyword arguments are passed to `Wrapper`. The wrapper is kept on
+    `app.extensions["tcp"]` so servers can drain it on shutdown.
+    """
+    wrapper = Wrapper(**options)
+    wrapper.app.extensions["tcp"] = wrapper
+    return wrapper.app
+
+
+def serve(
+    host="0.0.0.0",
+    port=5000,
+    workers=1,
+    threads=8,
+    keepalive=5,
+    timeout=600,
+    graceful_timeout=300,
+    **options,
+):
+    """Run the API under gunicorn with threaded workers.
+
+    Each worker process owns its own job table, so texture jobs must be
+    polled on the worker that created them; scale with `threads` first and
+    only use several `workers` behind a sticky load balancer. On SIGTERM
+    workers stop accepting jobs and drain in-flight ones for up to
+    `graceful_timeout` seconds.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    def worker_exit(server, worker):
+        wrapper = worker.wsgi.extensions.get("tcp")
+        if wrapper is not None:
+            wrapper.shutdown()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "threads": threads,
+                "worker_class": "gthread",
+                "keepalive": keepalive,
+                # Synchronous texture requests hold a thread for minutes
+                "timeout": timeout,
+                "graceful_timeout": graceful_timeout,
+                "worker_exit": worker_exit,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app(**options)
+
+    Application().run()
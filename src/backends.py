@@ -0,0 +1,120 @@
+import json
+import threading
+from urllib import request
+
+from src.comfy_socket import ComfyMonitor
+
+
+class Backend:
+    """A ComfyUI server with its own monitor connection and load figures"""
+
+    def __init__(self, address):
+        self.address = address
+        self.monitor = ComfyMonitor(address)
+        self.monitor.on_status = self.update_queue
+        self.queue_remaining = 0
+        self.in_flight = 0
+        self.failures = 0
+        self.healthy = True
+
+    @property
+    def load(self):
+        # Our own submissions may not be reflected in the queue status yet
+        return max(self.queue_remaining, self.in_flight)
+
+    def update_queue(self, queue_remaining):
+        self.queue_remaining = queue_remaining
+
+    def to_dict(self):
+        return {
+            "address": self.address,
+            "healthy": self.healthy,
+            "queue_remaining": self.queue_remaining,
+            "in_flight": self.in_flight,
+        }
+
+
+class BackendPool:
+    """Routes prompts to the least-loaded healthy ComfyUI backend.
+
+    Queue depth comes from the `status` WebSocket events of each backend and
+    from polling `/queue` in a background health check. A backend failing
+    `max_failures` checks or submissions in a row is ejected until a health
+    check succeeds again.
+    """
+
+    def __init__(self, addresses, health_interval=10, max_failures=3):
+        self.backends = [Backend(address) for address in addresses]
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the health check thread if it is not running yet"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(
+                target=self._health_loop, name="comfy-health", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        for backend in self.backends:
+            backend.monitor.stop()
+
+    def acquire(self):
+        """Pick the least-loaded healthy backend and count a job against it"""
+        with self.lock:
+            candidates = [
+                backend for backend in self.backends if backend.healthy
+            ]
+            if not candidates:
+                raise Exception("No healthy ComfyUI backend available")
+            backend = min(candidates, key=lambda backend: backend.load)
+            backend.in_flight += 1
+            return backend
+
+    def release(self, backend):
+        with self.lock:
+            backend.in_flight -= 1
+
+    def record_success(self, backend):
+        with self.lock:
+            backend.failures = 0
+            if not backend.healthy:
+                print(f"ComfyUI backend {backend.address} is healthy again")
+            backend.healthy = True
+
+    def record_failure(self, backend):
+        with self.lock:
+            backend.failures += 1
+            if backend.healthy and backend.failures >= self.max_failures:
+                print(f"Ejecting unhealthy ComfyUI backend {backend.address}")
+                backend.healthy = False
+
+    def check(self, backend):
+        """Poll a backend's queue; returns whether it answered"""
+        try:
+            url = f"http://{backend.address}/queue"
+            queue = json.loads(request.urlopen(url, timeout=5).read())
+        except Exception as e:
+            print(f"Health check failed for {backend.address}: {e}")
+            self.record_failure(backend)
+            return False
+
+        backend.update_queue(
+            len(queue.get("queue_running", []))
+            + len(queue.get("queue_pending", []))
+        )
+        self.record_success(backend)
+        return True
+
+    def _health_loop(self):
+        while not self.stopped.wait(self.health_interval):
+            for backend in self.backends:
+                self.check(backend)
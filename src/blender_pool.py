@@ -0,0 +1,168 @@
+import json
+import queue
+import subprocess
+import threading
+import time
+
+RESULT_PREFIX = "TCP-RESULT "
+WORKER_SCRIPT = "scripts/obj_gltf_worker.py"
+
+
+class ConversionError(Exception):
+    """Blender ran the job but could not convert the file"""
+
+
+class BlenderWorker:
+    """A headless Blender process serving conversion jobs over its stdio"""
+
+    def __init__(self, blender="blender", startup_timeout=60):
+        self.process = subprocess.Popen(
+            [blender, "-b", "--factory-startup", "-P", WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self.results = queue.Queue()
+        self.jobs_done = 0
+        self.reader = threading.Thread(
+            target=self._read_results, name="blender-worker", daemon=True
+        )
+        self.reader.start()
+
+        if self._next_result(startup_timeout).get("status") != "ready":
+            self.kill()
+            raise Exception("Blender worker failed to start")
+
+    def _read_results(self):
+        # Blender logs freely on stdout; only prefixed lines are replies
+        for line in self.process.stdout:
+            if line.startswith(RESULT_PREFIX):
+                self.results.put(json.loads(line[len(RESULT_PREFIX) :]))
+        self.results.put(None)
+
+    def _next_result(self, timeout):
+        try:
+            result = self.results.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Blender worker timed out")
+        if result is None:
+            raise Exception("Blender worker exited")
+        return result
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def convert(self, obj_path, output_dir, timeout):
+        """Convert `obj_path` to a GLB in `output_dir` and return its path"""
+        job = {"obj_path": obj_path, "output_dir": output_dir}
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+
+        result = self._next_result(timeout)
+        self.jobs_done += 1
+        if result.get("status") != "ok":
+            raise ConversionError(result.get("error", "Unknown Blender error"))
+        return result["glb_path"]
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class BlenderPool:
+    """Pool of warm Blender workers for OBJ to GLB conversion.
+
+    Workers are recycled after `max_jobs_per_worker` conversions and killed
+    when a job exceeds `timeout`. After `max_failures` consecutive failures
+    the pool reports itself unhealthy so callers can fall back to the
+    one-shot conversion script.
+    """
+
+    def __init__(
+        self,
+        size=2,
+        timeout=120,
+        max_jobs_per_worker=50,
+        max_failures=3,
+        retry_after=60,
+        blender="blender",
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.blender = blender
+        self.idle = queue.Queue()
+        self.slots = threading.Semaphore(size)
+        self.failures = 0
+        self.last_failure = 0
+        self.lock = threading.Lock()
+
+    @property
+    def healthy(self):
+        # An unhealthy pool is probed again once `retry_after` has passed
+        return (
+            self.failures < self.max_failures
+            or time.monotonic() - self.last_failure > self.retry_after
+        )
+
+    def start(self):
+        """Spawn all workers up front so the first jobs find them warm"""
+        for _ in range(self.size):
+            try:
+                self.idle.put(BlenderWorker(self.blender))
+            except Exception as e:
+                print(f"Error starting Blender worker: {e}")
+                self._record(success=False)
+
+    def _record(self, success):
+        with self.lock:
+            if success:
+                self.failures = 0
+            else:
+                self.failures += 1
+                self.last_failure = time.monotonic()
+
+    def convert(self, obj_path, output_dir):
+        """Run a conversion on an idle worker, spawning one if needed"""
+        with self.slots:
+            worker = None
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            try:
+                if worker is None or not worker.alive:
+                    worker = BlenderWorker(self.blender)
+                glb_path = worker.convert(obj_path, output_dir, self.timeout)
+            except ConversionError:
+                # The worker itself is fine, only this input is bad
+                self._release(worker)
+                raise
+            except Exception:
+                self._record(success=False)
+                if worker is not None:
+                    worker.kill()
+                raise
+
+            self._record(success=True)
+            self._release(worker)
+            return glb_path
+
+    def _release(self, worker):
+        if worker.jobs_done >= self.max_jobs_per_worker:
+            worker.kill()
+        else:
+            self.idle.put(worker)
+
+    def shutdown(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().kill()
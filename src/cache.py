@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def content_key(*parts):
+    """Stable SHA-256 hex digest of JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed GLB cache on local disk with LRU eviction.
+
+    Entries are stored as `<key>.glb` (or another `suffix`) in `cache_dir`.
+    The least recently used entries are evicted once the cache holds more
+    than `max_bytes` or `max_entries`. Existing entries are picked up again
+    on restart, ordered by modification time.
+    """
+
+    def __init__(
+        self, cache_dir, max_bytes=1024**3, max_entries=1000, suffix=".glb"
+    ):
+        self.cache_dir = cache_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        existing = []
+        for name in os.listdir(cache_dir):
+            if name.endswith(suffix):
+                stat = os.stat(os.path.join(cache_dir, name))
+                existing.append(
+                    (stat.st_mtime, name[: -len(suffix)], stat.st_size)
+                )
+        for _, key, size in sorted(existing):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def get_path(self, key):
+        """Return the path of the cached file for `key`, or None on a miss"""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+        path = self.path(key)
+        try:
+            os.utime(path)
+            return path
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+
+    def get(self, key):
+        """Return the cached bytes for `key`, or None on a miss"""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        """Store `data` under `key`, evicting old entries if needed"""
+        # Write atomically so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.entries and (
+            self.total_bytes > self.max_bytes
+            or len(self.entries) > self.max_entries
+        ):
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
@@ -0,0 +1,222 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib import request
+
+import websocket
+
+# Events for prompts nobody is waiting on yet (e.g. received before the
+# queue response came back) are kept for this many prompt ids.
+MAX_ORPHAN_PROMPTS = 64
+
+
+class PromptWatch:
+    """Completion state of a single prompt tracked by the monitor"""
+
+    def __init__(self, prompt_id, on_message=None):
+        self.prompt_id = prompt_id
+        self.on_message = on_message
+        self.finished = threading.Event()
+        self.success = False
+        self.error = None
+        self.started = False
+        self.last_activity = time.monotonic()
+
+    def resolve(self, success, error=None):
+        self.success = success
+        self.error = error
+        self.finished.set()
+
+
+class ComfyMonitor:
+    """Single shared WebSocket connection to ComfyUI.
+
+    A background thread receives every execution event for our client id and
+    dispatches it to the `PromptWatch` registered for its `prompt_id`. The
+    connection is re-established automatically; after each reconnect the
+    history of every pending prompt is checked so completions missed while
+    disconnected are not lost. Unless `previews` is set, the patched server
+    is asked not to encode and send preview images to this client.
+    """
+
+    def __init__(
+        self,
+        server_address,
+        reconnect_delay=1.0,
+        max_reconnect_delay=30.0,
+        previews=False,
+    ):
+        self.server_address = server_address
+        self.previews = previews
+        self.client_id = str(uuid.uuid4())
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.watches = {}
+        self.orphans = OrderedDict()
+        self.lock = threading.Lock()
+        self.connected = threading.Event()
+        self.thread = None
+        self.ws = None
+        self.stopping = False
+        # Called with the server's queue_remaining on every status event
+        self.on_status = None
+
+    def start(self):
+        """Start the background receiver thread if it is not running yet"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopping = False
+            self.thread = threading.Thread(
+                target=self._run, name="comfy-monitor", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+    def url(self):
+        url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+        if not self.previews:
+            url += "&previews=0"
+        return url
+
+    def watch(self, prompt_id, on_message=None):
+        """Register interest in a prompt and replay any buffered events"""
+        watch = PromptWatch(prompt_id, on_message)
+        with self.lock:
+            self.watches[prompt_id] = watch
+            buffered = self.orphans.pop(prompt_id, [])
+        for message in buffered:
+            self._deliver(watch, message)
+        return watch
+
+    def unwatch(self, prompt_id):
+        """Stop tracking a prompt"""
+        with self.lock:
+            self.watches.pop(prompt_id, None)
+
+    def wait(self, watch, timeout=300):
+        """Block until the prompt finishes; `timeout` is an inactivity limit"""
+        try:
+            while not watch.finished.wait(1):
+                if time.monotonic() - watch.last_activity > timeout:
+                    print(f"Timed out waiting for prompt {watch.prompt_id}")
+                    return False
+            return watch.success
+        finally:
+            self.unwatch(watch.prompt_id)
+
+    def dispatch(self, message):
+        """Route a decoded WebSocket message to the prompt it belongs to
+
+        The message is stamped with its monotonic receive time as
+        `received_at`, which buffered events keep until they are replayed.
+        """
+        message.setdefault("received_at", time.monotonic())
+        data = message.get("data")
+        if message.get("type") == "status":
+            # The queue is moving, so prompts still waiting in it are not
+            # stalled even though they receive no events of their own
+            now = time.monotonic()
+            with self.lock:
+                for watch in self.watches.values():
+                    if not watch.started:
+                        watch.last_activity = now
+            if self.on_status is not None:
+                try:
+                    exec_info = data["status"]["exec_info"]
+                    self.on_status(exec_info["queue_remaining"])
+                except (KeyError, TypeError):
+                    pass
+            return
+
+        if not isinstance(data, dict) or "prompt_id" not in data:
+            return
+
+        prompt_id = data["prompt_id"]
+        with self.lock:
+            watch = self.watches.get(prompt_id)
+            if watch is None:
+                self.orphans.setdefault(prompt_id, []).append(message)
+                self.orphans.move_to_end(prompt_id)
+                while len(self.orphans) > MAX_ORPHAN_PROMPTS:
+                    self.orphans.popitem(last=False)
+                return
+
+        self._deliver(watch, message)
+
+    def _deliver(self, watch, message):
+        watch.started = True
+        watch.last_activity = time.monotonic()
+        if watch.on_message is not None:
+            try:
+                watch.on_message(message)
+            except Exception as e:
+                print(f"Error in prompt message handler: {e}")
+
+        if message["type"] == "execution_success":
+            watch.resolve(True)
+        elif message["type"] == "execution_error":
+            watch.resolve(False, message["data"].get("error", "Unknown error"))
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self.stopping:
+            try:
+                self.ws = websocket.WebSocket()
+                self.ws.settimeout(30)
+                self.ws.connect(self.url())
+                self.connected.set()
+                delay = self.reconnect_delay
+                self._resubscribe()
+
+                while not self.stopping:
+                    try:
+                        out = self.ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        self.ws.ping()
+                        continue
+                    if isinstance(out, str):
+                        self.dispatch(json.loads(out))
+            except Exception as e:
+                if not self.stopping:
+                    print(f"ComfyUI WebSocket disconnected: {e}")
+            finally:
+                self.connected.clear()
+                try:
+                    self.ws.close()
+                except Exception:
+                    pass
+
+            if not self.stopping:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _resubscribe(self):
+        """Resolve pending prompts that finished while we were disconnected"""
+        with self.lock:
+            pending = list(self.watches.values())
+
+        for watch in pending:
+            try:
+                url = f"http://{self.server_address}/history/{watch.prompt_id}"
+                history = json.loads(request.urlopen(url, timeout=10).read())
+            except Exception as e:
+                print(f"Error fetching history for {watch.prompt_id}: {e}")
+                continue
+
+            entry = history.get(watch.prompt_id)
+            if not entry:
+                continue
+            status = entry.get("status", {})
+            if status.get("status_str") == "error":
+                watch.resolve(False, "Execution failed while disconnected")
+            elif status.get("completed"):
+                watch.resolve(True)
@@ -0,0 +1,110 @@
+import http.client
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HTTPConnection(http.client.HTTPConnection):
+    """Connection with separate connect and read timeouts"""
+
+    def __init__(self, host, connect_timeout, read_timeout):
+        super().__init__(host, timeout=connect_timeout)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections, pooled per host.
+
+    `timeout` bounds every socket operation; `connect_timeout`, if given,
+    applies to establishing the connection instead.
+    """
+
+    def __init__(self, max_per_host=4, timeout=60, connect_timeout=None):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _idle_queue(self, host):
+        with self.lock:
+            if host not in self.idle:
+                self.idle[host] = queue.LifoQueue(maxsize=self.max_per_host)
+            return self.idle[host]
+
+    @contextmanager
+    def connection(self, host):
+        """Borrow a connection to `host`, returning it to the pool if healthy"""
+        try:
+            conn = self._idle_queue(host).get_nowait()
+        except queue.Empty:
+            conn = HTTPConnection(
+                host, self.connect_timeout or self.timeout, self.timeout
+            )
+
+        try:
+            yield conn
+        except BaseException:
+            # Also covers abandoned generators, whose response was not
+            # read to the end and cannot be reused
+            conn.close()
+            raise
+
+        try:
+            self._idle_queue(host).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def download(self, host, path, save_path, chunk_size=CHUNK_SIZE):
+        """Stream `path` from `host` into `save_path` without buffering it.
+
+        Returns the number of bytes written and the elapsed time in seconds.
+        Raises if the server answers with an error or a truncated body.
+        """
+        start = time.monotonic()
+        try:
+            size = self._download(host, path, save_path, chunk_size)
+        except (http.client.RemoteDisconnected, ConnectionResetError):
+            # The server may have dropped an idle keep-alive connection
+            size = self._download(host, path, save_path, chunk_size)
+        return size, time.monotonic() - start
+
+    def _download(self, host, path, save_path, chunk_size):
+        with self.connection(host) as conn:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            if response.status != 200:
+                response.read()
+                raise Exception(f"HTTP {response.status} {response.reason}")
+
+            expected = response.getheader("Content-Length")
+            size = 0
+            with open(save_path, "wb") as f:
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+
+            if expected is not None and int(expected) != size:
+                raise Exception(
+                    f"Incomplete download: got {size} of {expected} bytes"
+                )
+
+        return size
+
+    def close(self):
+        with self.lock:
+            pools = list(self.idle.values())
+            self.idle = {}
+        for idle in pools:
+            while not idle.empty():
+                idle.get_nowait().close()
@@ -0,0 +1,317 @@
+import json
+import math
+import os
+import struct
+
+import numpy as np
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+COMPONENT_FLOAT = 5126
+COMPONENT_UNSIGNED_SHORT = 5123
+COMPONENT_UNSIGNED_INT = 5125
+TARGET_ARRAY_BUFFER = 34962
+TARGET_ELEMENT_ARRAY_BUFFER = 34963
+
+
+def parse_mtl(path):
+    """Parse the materials of an MTL file into plain dicts"""
+    materials = {}
+    current = None
+    base_dir = os.path.dirname(path)
+
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+            keyword, args = parts[0], parts[1:]
+
+            if keyword == "newmtl":
+                current = {"name": " ".join(args)}
+                materials[current["name"]] = current
+            elif current is None:
+                continue
+            elif keyword == "Kd" and len(args) >= 3:
+                current["Kd"] = [float(x) for x in args[:3]]
+            elif keyword == "Ns" and args:
+                current["Ns"] = float(args[0])
+            elif keyword == "map_Kd" and args:
+                # Options such as `-s 1 1 1` may precede the file name
+                current["map_Kd"] = os.path.join(base_dir, args[-1])
+
+    return materials
+
+
+def parse_obj(path):
+    """Parse an OBJ file into arrays and per-material triangle corners.
+
+    Returns `(positions, texcoords, normals, groups, mtllibs)` where `groups`
+    maps a material name to an `(n, 3)` array of `(v, vt, vn)` zero-based
+    indices, one row per triangle corner (-1 marks a missing index).
+    """
+    positions = []
+    texcoords = []
+    normals = []
+    mtllibs = []
+    groups = {}
+    corners = groups.setdefault(None, [])
+
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("v "):
+                positions.append(line.split()[1:4])
+            elif line.startswith("vt "):
+                texcoords.append(line.split()[1:3])
+            elif line.startswith("vn "):
+                normals.append(line.split()[1:4])
+            elif line.startswith("f "):
+                face = []
+                for vertex in line.split()[1:]:
+                    indices = vertex.split("/")
+                    face.append(
+                        [
+                            _resolve_index(indices, 0, len(positions)),
+                            _resolve_index(indices, 1, len(texcoords)),
+                            _resolve_index(indices, 2, len(normals)),
+                        ]
+                    )
+                # Triangulate polygons as a fan around the first corner
+                for i in range(1, len(face) - 1):
+                    corners.extend((face[0], face[i], face[i + 1]))
+            elif line.startswith("usemtl "):
+                corners = groups.setdefault(line[len("usemtl ") :].strip(), [])
+            elif line.startswith("mtllib "):
+                mtllibs.append(
+                    os.path.join(
+                        os.path.dirname(path), line.split(None, 1)[1].strip()
+                    )
+                )
+
+    groups = {
+        name: np.array(corners, dtype=np.int64).reshape(-1, 3)
+        for name, corners in groups.items()
+        if corners
+    }
+    return (
+        np.array(positions, dtype=np.float32).reshape(-1, 3),
+        np.array(texcoords, dtype=np.float32).reshape(-1, 2),
+        np.array(normals, dtype=np.float32).reshape(-1, 3),
+        groups,
+        mtllibs,
+    )
+
+
+def _resolve_index(indices, slot, count):
+    """Convert a one-based (or negative, relative) OBJ index to zero-based"""
+    if slot >= len(indices) or not indices[slot]:
+        return -1
+    index = int(indices[slot])
+    return index - 1 if index > 0 else count + index
+
+
+def compute_normals(positions, triangles):
+    """Area-weighted smooth vertex normals for an indexed triangle list"""
+    corners = positions[triangles.reshape(-1, 3)]
+    face_normals = np.cross(
+        corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+    )
+    normals = np.zeros_like(positions)
+    for i in range(3):
+        np.add.at(normals, triangles.reshape(-1, 3)[:, i], face_normals)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths == 0, 1, lengths)
+
+
+class GLBBuilder:
+    """Accumulates glTF JSON and binary buffer data for a single GLB file"""
+
+    def __init__(self):
+        self.gltf = {
+            "asset": {"version": "2.0", "generator": "TCP GLB writer"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "materials": [],
+            "textures": [],
+            "images": [],
+            "samplers": [],
+            "accessors": [],
+            "bufferViews": [],
+            "buffers": [],
+        }
+        self.chunks = []
+        self.length = 0
+
+    def add_buffer_view(self, data, target=None):
+        padding = (-self.length) % 4
+        if padding:
+            self.chunks.append(b"\x00" * padding)
+            self.length += padding
+
+        view = {"buffer": 0, "byteOffset": self.length, "byteLength": len(data)}
+        if target is not None:
+            view["target"] = target
+        self.chunks.append(data)
+        self.length += len(data)
+        self.gltf["bufferViews"].append(view)
+        return len(self.gltf["bufferViews"]) - 1
+
+    def add_accessor(self, array, accessor_type, target, with_bounds=False):
+        if array.dtype == np.float32:
+            component = COMPONENT_FLOAT
+        elif array.dtype == np.uint16:
+            component = COMPONENT_UNSIGNED_SHORT
+        else:
+            component = COMPONENT_UNSIGNED_INT
+
+        accessor = {
+            "bufferView": self.add_buffer_view(
+                np.ascontiguousarray(array).tobytes(), target
+            ),
+            "componentType": component,
+            "count": len(array),
+            "type": accessor_type,
+        }
+        if with_bounds:
+            accessor["min"] = array.min(axis=0).tolist()
+            accessor["max"] = array.max(axis=0).tolist()
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def add_material(self, material):
+        pbr = {"baseColorFactor": material.get("Kd", [1.0, 1.0, 1.0]) + [1.0]}
+        # Same mapping as Blender's OBJ importer
+        pbr["metallicFactor"] = 0.0
+        pbr["roughnessFactor"] = 1.0 - math.sqrt(
+            min(max(material.get("Ns", 0.0), 0.0), 1000.0) / 1000.0
+        )
+
+        texture_path = material.get("map_Kd")
+        if texture_path and os.path.exists(texture_path):
+            with open(texture_path, "rb") as f:
+                image_view = self.add_buffer_view(f.read())
+            mime_type = (
+                "image/jpeg"
+                if texture_path.lower().endswith((".jpg", ".jpeg"))
+                else "image/png"
+            )
+            self.gltf["images"].append(
+                {"bufferView": image_view, "mimeType": mime_type}
+            )
+            if not self.gltf["samplers"]:
+                self.gltf["samplers"].append(
+                    {"magFilter": 9729, "minFilter": 9987}
+                )
+            self.gltf["textures"].append(
+                {"sampler": 0, "source": len(self.gltf["images"]) - 1}
+            )
+            pbr["baseColorTexture"] = {"index": len(self.gltf["textures"]) - 1}
+            pbr["baseColorFactor"] = [1.0, 1.0, 1.0, 1.0]
+        elif texture_path:
+            print(f"Warning: texture not found: {texture_path}")
+
+        self.gltf["materials"].append(
+            {
+                "name": material.get("name", "material"),
+                "pbrMetallicRoughness": pbr,
+            }
+        )
+        return len(self.gltf["materials"]) - 1
+
+    def to_bytes(self):
+        binary = b"".join(self.chunks)
+        binary += b"\x00" * ((-len(binary)) % 4)
+        self.gltf["buffers"] = [{"byteLength": len(binary)}]
+
+        gltf = {key: value for key, value in self.gltf.items() if value != []}
+        json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+        json_chunk += b" " * ((-len(json_chunk)) % 4)
+
+        total = 12 + 8 + len(json_chunk) + 8 + len(binary)
+        return b"".join(
+            [
+                struct.pack("<III", GLB_MAGIC, GLB_VERSION, total),
+                struct.pack("<II", len(json_chunk), CHUNK_JSON),
+                json_chunk,
+                struct.pack("<II", len(binary), CHUNK_BIN),
+                binary,
+            ]
+        )
+
+
+def obj_to_glb(obj_path, scale=18.0):
+    """Convert a textured OBJ (with its MTL) to binary glTF bytes.
+
+    Mirrors `scripts/obj_gltf.py`: the mesh is scaled uniformly around the
+    origin and the diffuse texture is embedded in the GLB.
+    """
+    positions, texcoords, normals, groups, mtllibs = parse_obj(obj_path)
+    if not groups:
+        raise ValueError(f"No faces found in {obj_path}")
+
+    materials = {}
+    for mtllib in mtllibs:
+        if os.path.exists(mtllib):
+            materials.update(parse_mtl(mtllib))
+
+    builder = GLBBuilder()
+    primitives = []
+    material_indices = {}
+    name = os.path.splitext(os.path.basename(obj_path))[0]
+
+    for material_name, corners in groups.items():
+        # One glTF vertex per distinct (v, vt, vn) combination
+        unique, inverse = np.unique(corners, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        vertex_positions = positions[unique[:, 0]] * np.float32(scale)
+        attributes = {
+            "POSITION": builder.add_accessor(
+                vertex_positions, "VEC3", TARGET_ARRAY_BUFFER, with_bounds=True
+            )
+        }
+
+        if len(normals) and (unique[:, 2] >= 0).all():
+            vertex_normals = normals[unique[:, 2]]
+        else:
+            vertex_normals = compute_normals(vertex_positions, inverse)
+        attributes["NORMAL"] = builder.add_accessor(
+            vertex_normals.astype(np.float32), "VEC3", TARGET_ARRAY_BUFFER
+        )
+
+        if len(texcoords) and (unique[:, 1] >= 0).all():
+            uvs = texcoords[unique[:, 1]].copy()
+            # glTF puts the texture origin in the top-left corner
+            uvs[:, 1] = 1.0 - uvs[:, 1]
+            attributes["TEXCOORD_0"] = builder.add_accessor(
+                uvs, "VEC2", TARGET_ARRAY_BUFFER
+            )
+
+        index_type = np.uint16 if len(unique) < 65536 else np.uint32
+        primitive = {
+            "attributes": attributes,
+            "indices": builder.add_accessor(
+                inverse.astype(index_type),
+                "SCALAR",
+                TARGET_ELEMENT_ARRAY_BUFFER,
+            ),
+            "mode": 4,
+        }
+
+        if material_name is not None:
+            if material_name not in material_indices:
+                material_indices[material_name] = builder.add_material(
+                    materials.get(material_name, {"name": material_name})
+                )
+            primitive["material"] = material_indices[material_name]
+        primitives.append(primitive)
+
+    builder.gltf["meshes"].append({"name": name, "primitives": primitives})
+    builder.gltf["nodes"].append({"name": name, "mesh": 0})
+    builder.gltf["scenes"][0]["nodes"].append(0)
+    return builder.to_bytes()
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """State of a single asynchronous texture generation"""
+
+    def __init__(self, user_prompt):
+        self.id = uuid.uuid4().hex
+        self.user_prompt = user_prompt
+        self.status = "queued"
+        self.stage = "queued"
+        self.node = None
+        # Sampler progress of the running node as [value, max]
+        self.step = None
+        self.error = None
+        self.result_path = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Admission ticket while the job waits for a generation slot
+        self.ticket = None
+        # Bumped on every update so watchers can wait for changes
+        self.version = 0
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "node": self.node,
+            "step": self.step,
+            "error": self.error,
+            "user_prompt": self.user_prompt,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """In-process job table backed by a bounded thread pool"""
+
+    def __init__(self, max_workers=2, job_ttl=3600):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="texture-job"
+        )
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.results_dir = tempfile.mkdtemp(prefix="tcp-jobs-")
+        self.accepting = True
+
+    def submit(self, user_prompt, target):
+        """Register a new job and schedule `target(job)` on the pool.
+
+        `target` must call `start(job)` once the generation begins and return
+        the generated GLB bytes; any exception it raises marks the job as
+        failed. Returns None once the manager is shutting down.
+        """
+        if not self.accepting:
+            return None
+        self.prune()
+        job = Job(user_prompt)
+        with self.lock:
+            self.jobs[job.id] = job
+        try:
+            self.executor.submit(self._run, job, target)
+        except RuntimeError:
+            # The executor was shut down after the check above
+            with self.lock:
+                del self.jobs[job.id]
+            return None
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def update(self, job, **fields):
+        with self.lock:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.version += 1
+            self.changed.notify_all()
+
+    def start(self, job):
+        """Mark `job` as running"""
+        self.update(job, status="running", started_at=time.time())
+
+    def wait_for_update(self, job, version=None, timeout=None):
+        """Wait until `job` changes past `version`.
+
+        Returns the job's current version and a consistent snapshot of it,
+        also when `timeout` expires without a change.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: job.version != version, timeout)
+            return job.version, job.to_dict()
+
+    def _run(self, job, target):
+        try:
+            glb_data = target(job)
+            result_path = os.path.join(self.results_dir, f"{job.id}.glb")
+            with open(result_path, "wb") as f:
+                f.write(glb_data)
+            self.update(
+                job,
+                status="completed",
+                stage="completed",
+                node=None,
+                step=None,
+                result_path=result_path,
+                finished_at=time.time(),
+            )
+        except Exception as e:
+            print(f"Job {job.id} failed: {str(e)}")
+            self.update(
+                job,
+                status="failed",
+                stage="failed",
+                error=str(e),
+                finished_at=time.time(),
+            )
+
+    def prune(self):
+        """Forget finished jobs older than the configured TTL"""
+        now = time.time()
+        with self.lock:
+            expired = [
+                job
+                for job in self.jobs.values()
+                if job.done and now - job.finished_at > self.job_ttl
+            ]
+            for job in expired:
+                del self.jobs[job.id]
+
+        for job in expired:
+            if job.result_path and os.path.exists(job.result_path):
+                os.remove(job.result_path)
+
+    @property
+    def in_flight(self):
+        with self.lock:
+            return sum(not job.done for job in self.jobs.values())
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and, if `wait`, drain the ones in flight"""
+        self.accepting = False
+        self.executor.shutdown(wait=wait)
+        shutil.rmtree(self.results_dir, ignore_errors=True)
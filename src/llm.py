@@ -0,0 +1,339 @@
+import hashlib
+import http.client
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from src.downloads import ConnectionPool
+
+# Asked once per system prompt so the model has evaluated it; it and the
+# single token answering it stay in the context ahead of every story
+PRIMING_PROMPT = "Hello."
+
+# The still JSON-escaped text of a token line such as
+# {"model":"mistral","created_at":"...","response":"Once","done":false}
+RESPONSE_PATTERN = re.compile(rb'"response":"((?:[^"\\]|\\.)*)"')
+
+
+def parse_line(line):
+    """Parse a line of an Ollama stream without decoding plain tokens.
+
+    Returns `(fragment, None)` for an intermediate token, where `fragment`
+    is the token text still escaped as a JSON string body (bytes), or
+    `(None, chunk)` with the decoded chunk for any other line.
+    """
+    if b'"done":false' in line:
+        match = RESPONSE_PATTERN.search(line)
+        if match is not None:
+            return match.group(1), None
+    chunk = json.loads(line)
+    if "error" in chunk:
+        raise Exception(f"Ollama error: {chunk['error']}")
+    return None, chunk
+
+
+class TokenCoalescer:
+    """Batches streamed tokens into SSE `text` frames.
+
+    A frame is sent once the oldest buffered token is `window` seconds old
+    or `max_bytes` are buffered, checked whenever a token arrives, and at
+    the end of the stream. A `window` of 0 sends every token on its own.
+    The final chunk of the stream is kept in `final`, the full text is
+    available from `text()`.
+    """
+
+    def __init__(self, window=0.04, max_bytes=4096):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.final = None
+        self.fragments = []
+
+    def frames(self, lines):
+        buffered = []
+        size = 0
+        started = None
+        for line in lines:
+            fragment, chunk = parse_line(line)
+            if chunk is not None:
+                self.final = chunk
+                text = chunk.get("response")
+                if not text:
+                    continue
+                # Escaped the same way as the raw fragments
+                fragment = json.dumps(text, ensure_ascii=False)[1:-1]
+                fragment = fragment.encode("utf-8")
+
+            if not buffered:
+                started = time.monotonic()
+            self.fragments.append(fragment)
+            buffered.append(fragment)
+            size += len(fragment)
+            if (
+                size >= self.max_bytes
+                or time.monotonic() - started >= self.window
+            ):
+                yield self.frame(buffered)
+                buffered, size = [], 0
+
+        if buffered:
+            yield self.frame(buffered)
+
+    def text(self):
+        """Everything streamed so far, decoded"""
+        return json.loads(b'"' + b"".join(self.fragments) + b'"')
+
+    @staticmethod
+    def frame(fragments):
+        return b'data: {"text": "' + b"".join(fragments) + b'"}\n\n'
+
+
+def replay(frames, speed=1.0):
+    """Yield recorded SSE frames paced like the stream they came from.
+
+    `frames` holds `(offset, frame)` pairs, offsets being seconds since the
+    stream started. `speed` divides the offsets: 1.0 keeps the original
+    timing, larger values compress it and 0 sends everything at once.
+    """
+    started = time.monotonic()
+    for offset, frame in frames:
+        if speed > 0:
+            delay = offset / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        yield frame
+
+
+class LLMStream:
+    """Raw lines of one streaming Ollama request, see `parse_line()`.
+
+    Holds a generation slot of its client until it is exhausted or closed.
+    Closing it early drops the upstream connection, which makes Ollama stop
+    generating.
+    """
+
+    def __init__(self, client, path, payload):
+        self.client = client
+        self.path = path
+        self.body = json.dumps(payload).encode("utf-8")
+        self.started = False
+        self.released = False
+        self.lock = threading.Lock()
+        self.iterator = self._iterate()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.iterator)
+
+    def close(self):
+        """Abort the request if it is still running and free the slot"""
+        try:
+            self.iterator.close()
+        finally:
+            # A generator closed before it started never runs its finally
+            self._release()
+
+    def _release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        self.client.slots.release()
+
+    def _iterate(self):
+        try:
+            yield from self._request()
+        except (http.client.RemoteDisconnected, ConnectionResetError):
+            if self.started:
+                raise
+            # The server may have dropped an idle keep-alive connection
+            yield from self._request()
+        finally:
+            self._release()
+
+    def _request(self):
+        with self.client.pool.connection(self.client.address) as conn:
+            conn.request(
+                "POST",
+                self.path,
+                body=self.body,
+                headers={"Content-Type": "application/json"},
+            )
+            response = conn.getresponse()
+            if response.status != 200:
+                body = response.read().decode("utf-8", "replace")
+                raise Exception(
+                    f"Ollama returned HTTP {response.status}: {body}"
+                )
+
+            for line in response:
+                if not line.strip():
+                    continue
+                self.started = True
+                yield line
+
+
+class OllamaClient:
+    """Ollama client with pooled keep-alive connections.
+
+    At most `max_concurrent` generations run at once; `stream()` waits up to
+    `queue_timeout` seconds for a free slot. `read_timeout` bounds the wait
+    for each streamed line, not the whole generation.
+    """
+
+    def __init__(
+        self,
+        address,
+        max_concurrent=4,
+        connect_timeout=5.0,
+        read_timeout=120.0,
+        queue_timeout=10.0,
+    ):
+        self.address = address
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.pool = ConnectionPool(
+            max_per_host=max_concurrent,
+            timeout=read_timeout,
+            connect_timeout=connect_timeout,
+        )
+
+    @contextmanager
+    def slot(self):
+        """Hold a generation slot for a non-streaming request"""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise Exception("All Ollama generation slots are busy")
+        try:
+            yield
+        finally:
+            self.slots.release()
+
+    def stream(self, path, payload):
+        """Start a streaming request, or return None when all slots are busy"""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            return None
+        return LLMStream(self, path, payload)
+
+    def request(self, method, path, payload=None):
+        """Send a non-streaming request and return the decoded response"""
+        try:
+            return self._request(method, path, payload)
+        except (http.client.RemoteDisconnected, ConnectionResetError):
+            # The server may have dropped an idle keep-alive connection
+            return self._request(method, path, payload)
+
+    def _request(self, method, path, payload):
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+        with self.pool.connection(self.address) as conn:
+            conn.request(
+                method,
+                path,
+                body=body,
+                headers={"Content-Type": "application/json"},
+            )
+            response = conn.getresponse()
+            data = response.read()
+        if response.status != 200:
+            body = data.decode("utf-8", "replace")
+            raise Exception(f"Ollama returned HTTP {response.status}: {body}")
+        return json.loads(data)
+
+    def model_digest(self, model):
+        """Digest of the installed `model`, or None if it is not installed"""
+        for entry in self.request("GET", "/api/tags").get("models", []):
+            if entry.get("name") in (model, f"{model}:latest"):
+                return entry.get("digest")
+        return None
+
+    def generate(self, payload):
+        """Stream `/api/generate` lines; see `stream()`"""
+        return self.stream("/api/generate", {**payload, "stream": True})
+
+    def close(self):
+        self.pool.close()
+
+
+class ContextCache:
+    """Ollama context vectors of primed system prompts.
+
+    Priming runs a system prompt through the model once; later requests send
+    the returned context instead of the system prompt, so its tokens match
+    the server's cached prefix rather than being evaluated again. Entries
+    are primed again when the model's digest changes, which is checked at
+    most every `check_interval` seconds.
+
+    Requests never talk to Ollama: the one finding an entry due starts a
+    background refresh and, like every request until it completes, uses
+    the context the entry already has, if any. After a failure the entry is
+    left alone for `retry_delay` seconds. Priming takes one of the client's
+    generation slots.
+    """
+
+    def __init__(self, client, check_interval=60.0, retry_delay=30.0):
+        self.client = client
+        self.check_interval = check_interval
+        self.retry_delay = retry_delay
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, model, system):
+        """Context for `system` on `model`, or None while there is none"""
+        key = (model, hashlib.sha256(system.encode("utf-8")).hexdigest())
+        with self.lock:
+            entry = self.entries.setdefault(
+                key,
+                {"digest": None, "context": None, "due_at": 0.0, "busy": False},
+            )
+            if entry["busy"] or time.monotonic() < entry["due_at"]:
+                return entry["context"]
+            entry["busy"] = True
+            context = entry["context"]
+
+        threading.Thread(
+            target=self._refresh,
+            args=(entry, model, system),
+            name="llm-priming",
+            daemon=True,
+        ).start()
+        return context
+
+    def _refresh(self, entry, model, system):
+        delay = self.retry_delay
+        try:
+            digest = self.client.model_digest(model)
+            if entry["context"] is None or entry["digest"] != digest:
+                with self.lock:
+                    # Belongs to the previous model
+                    entry["context"] = None
+                print(f"Priming the system prompt on {model}")
+                context = self.prime(model, system)
+                with self.lock:
+                    entry["digest"], entry["context"] = digest, context
+            delay = self.check_interval
+        except Exception as e:
+            print(f"Error priming the system prompt: {e}")
+        finally:
+            with self.lock:
+                entry["due_at"] = time.monotonic() + delay
+                entry["busy"] = False
+
+    def prime(self, model, system):
+        with self.client.slot():
+            response = self.client.request(
+                "POST",
+                "/api/generate",
+                {
+                    "model": model,
+                    "system": system,
+                    "prompt": PRIMING_PROMPT,
+                    "stream": False,
+                    "options": {"num_predict": 1},
+                },
+            )
+        return response["context"]
@@ -0,0 +1,162 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list of samples"""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(durations):
+    """Count, percentiles, mean and total of a non-empty list of seconds"""
+    return {
+        "count": len(durations),
+        "p50": round(percentile(durations, 0.5), 4),
+        "p95": round(percentile(durations, 0.95), 4),
+        "mean": round(sum(durations) / len(durations), 4),
+        "total": round(sum(durations), 4),
+    }
+
+
+class NodeTimer:
+    """Turns the execution events of one prompt into per-node durations.
+
+    ComfyUI announces each node with an `executing` message when it starts;
+    a node runs until the next `executing` message or the end of the prompt.
+    Cached nodes are never announced and so are not timed. Events are timed
+    by their `received_at` stamp when they carry one, so replayed events
+    keep the time they arrived.
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.node = None
+        self.started_at = None
+
+    def handle(self, message):
+        now = message.get("received_at")
+        if now is None:
+            now = time.monotonic()
+        kind = message.get("type")
+        if kind == "executing":
+            self.finish(now)
+            node = message["data"].get("node")
+            if node:
+                self.node, self.started_at = node, now
+        elif kind in ("execution_success", "execution_error"):
+            self.finish(now)
+
+    def finish(self, now):
+        if self.node is not None:
+            self.profiler.record(self.node, now - self.started_at)
+        self.node = None
+
+
+class NodeProfiler:
+    """Per-node execution times of a workflow, aggregated across prompts.
+
+    The last `max_samples` durations of every node are kept and, when `path`
+    is set, persisted as JSON by `save()` so the profile survives restarts.
+    """
+
+    def __init__(self, workflow, path=None, max_samples=500, name="workflow"):
+        self.class_types = {
+            node_id: node.get("class_type")
+            for node_id, node in (workflow or {}).items()
+        }
+        self.path = path
+        self.max_samples = max_samples
+        self.name = name
+        self.samples = {}
+        self.lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    for node_id, durations in json.load(f).items():
+                        self.samples[node_id] = deque(
+                            durations, maxlen=max_samples
+                        )
+            except Exception as e:
+                print(f"Error loading node profile: {e}")
+
+    def timer(self):
+        return NodeTimer(self)
+
+    def record(self, node_id, duration):
+        with self.lock:
+            samples = self.samples.get(node_id)
+            if samples is None:
+                samples = deque(maxlen=self.max_samples)
+                self.samples[node_id] = samples
+            samples.append(duration)
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = {
+                node: list(durations)
+                for node, durations in self.samples.items()
+            }
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving node profile: {e}")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                node: list(durations)
+                for node, durations in self.samples.items()
+                if durations
+            }
+
+    def stats(self):
+        """Per-node statistics, slowest total time first"""
+        stats = [
+            {
+                "node": node_id,
+                "class_type": self.class_types.get(node_id),
+                **summarize(durations),
+            }
+            for node_id, durations in self.snapshot().items()
+        ]
+        stats.sort(key=lambda entry: entry["total"], reverse=True)
+        return stats
+
+    def class_type_stats(self):
+        """Statistics over all nodes of each class type, slowest first"""
+        by_class = {}
+        for node_id, durations in self.snapshot().items():
+            class_type = self.class_types.get(node_id) or "unknown"
+            by_class.setdefault(class_type, []).extend(durations)
+
+        stats = [
+            {"class_type": class_type, **summarize(durations)}
+            for class_type, durations in by_class.items()
+        ]
+        stats.sort(key=lambda entry: entry["total"], reverse=True)
+        return stats
+
+    def folded(self):
+        """Collapsed stacks for flame graph tools, weighted by median ms"""
+        lines = []
+        for entry in self.stats():
+            class_type = entry["class_type"] or "unknown"
+            weight = max(1, round(entry["p50"] * 1000))
+            lines.append(
+                f"{self.name};{class_type};node {entry['node']} {weight}"
+            )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def estimate_tokens(text):
+    """Rough token count of English text, about four characters per token"""
+    return len(text) // 4 + 1
+
+
+class Session:
+    """Conversation state of a multi-turn adventure"""
+
+    def __init__(self, model, session_id=None):
+        self.id = session_id or uuid.uuid4().hex
+        self.model = model
+        # Ollama context after the last turn; None until the first one ends
+        self.context = None
+        self.turns = []
+        self.updated_at = time.time()
+
+    def add_turn(self, user_prompt, story, context):
+        self.turns.append({"user": user_prompt, "assistant": story})
+        self.context = context
+
+    def transcript(self, max_tokens):
+        """The most recent turns that fit `max_tokens`, as prompt text"""
+        parts = []
+        used = 0
+        for turn in reversed(self.turns):
+            part = f"Human: {turn['user']}\n\nAssistant: {turn['assistant']}"
+            used += estimate_tokens(part)
+            if used > max_tokens:
+                break
+            parts.append(part)
+        return "\n\n".join(reversed(parts))
+
+    def to_dict(self):
+        return {
+            "session_id": self.id,
+            "model": self.model,
+            "context": self.context,
+            "turns": self.turns,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data["model"], data["session_id"])
+        session.context = data["context"]
+        session.turns = data["turns"]
+        session.updated_at = data["updated_at"]
+        return session
+
+
+class SessionStore:
+    """Adventure sessions in an in-memory LRU that expires after `ttl`.
+
+    With `spill_dir`, sessions evicted from memory (and all of them on
+    `close()`) are written to disk as JSON and loaded back when used again,
+    so only `max_sessions` are held in memory.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=3600, spill_dir=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def create(self, model):
+        session = Session(model)
+        self.save(session)
+        return session
+
+    def get(self, session_id):
+        """Return the session, or None if it is unknown or expired"""
+        if not SESSION_ID_PATTERN.match(session_id or ""):
+            return None
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+        if session is None:
+            session = self._load(session_id)
+        if session is None or time.time() - session.updated_at > self.ttl:
+            self.discard(session_id)
+            return None
+        return session
+
+    def save(self, session):
+        session.updated_at = time.time()
+        self._insert(session)
+
+    def _insert(self, session):
+        with self.lock:
+            self.sessions[session.id] = session
+            self.sessions.move_to_end(session.id)
+            evicted = []
+            while len(self.sessions) > self.max_sessions:
+                evicted.append(self.sessions.popitem(last=False)[1])
+        for old in evicted:
+            self._spill(old)
+
+    def discard(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+        if self.spill_dir is not None:
+            try:
+                os.remove(self._path(session_id))
+            except OSError:
+                pass
+
+    def close(self):
+        """Spill every live session to disk, if spilling is enabled"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            self._spill(session)
+
+    def _path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _spill(self, session):
+        if self.spill_dir is None:
+            return
+        if time.time() - session.updated_at > self.ttl:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.spill_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(session.to_dict(), f)
+            os.replace(tmp_path, self._path(session.id))
+        except Exception as e:
+            print(f"Error spilling session {session.id}: {e}")
+
+    def _load(self, session_id):
+        if self.spill_dir is None:
+            return None
+        try:
+            with open(self._path(session_id), "r") as f:
+                session = Session.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading session {session_id}: {e}")
+            return None
+
+        # Memory is the source of truth again until the next spill
+        try:
+            os.remove(self._path(session_id))
+        except OSError:
+            pass
+        if time.time() - session.updated_at > self.ttl:
+            return None
+        self._insert(session)
+        return session
@@ -0,0 +1,88 @@
+import copy
+import json
+import re
+
+
+class WorkflowTemplate:
+    """ComfyUI workflow serialized once, with a few injectable inputs.
+
+    `fields` maps a field name to the `(node_id, input_name)` it fills. The
+    workflow is serialized at construction with placeholders for those
+    inputs and split into byte segments, so `render()` only has to encode
+    the per-request values and join. Nothing shared is mutated, which makes
+    rendering thread-safe without copying the graph.
+    """
+
+    def __init__(self, workflow, fields):
+        self.fields = dict(fields)
+        self.defaults = {}
+
+        workflow = copy.deepcopy(workflow)
+        placeholders = {}
+        for name, (node_id, input_name) in self.fields.items():
+            inputs = workflow[node_id]["inputs"]
+            self.defaults[name] = inputs.get(input_name)
+            placeholder = f"__tcp_field_{name}__"
+            inputs[input_name] = placeholder
+            placeholders[json.dumps(placeholder)] = name
+
+        pattern = "(" + "|".join(map(re.escape, placeholders)) + ")"
+        parts = re.split(pattern, json.dumps(workflow))
+        # Even items are literal JSON, odd items are the placeholders
+        self.segments = [part.encode("utf-8") for part in parts[::2]]
+        self.order = [placeholders[token] for token in parts[1::2]]
+
+    def render(self, **values):
+        """Serialized prompt JSON with `values` injected (bytes)"""
+        parts = [self.segments[0]]
+        for name, segment in zip(self.order, self.segments[1:]):
+            value = values[name] if name in values else self.defaults[name]
+            parts.append(json.dumps(value).encode("utf-8"))
+            parts.append(segment)
+        return b"".join(parts)
+
+
+def prune_workflow(workflow, outputs):
+    """Copy of `workflow` with only the nodes `outputs` depend on.
+
+    `outputs` lists the node ids or class types whose results are consumed.
+    Every other node, such as previews or debug renders, is dropped along
+    with everything only those nodes depend on.
+    """
+    pending = [
+        node_id
+        for node_id, node in workflow.items()
+        if node_id in outputs or node.get("class_type") in outputs
+    ]
+    if not pending:
+        raise ValueError(f"No workflow node matches outputs {list(outputs)}")
+
+    reachable = set()
+    while pending:
+        node_id = pending.pop()
+        if node_id in reachable:
+            continue
+        reachable.add(node_id)
+        # Links are [source_node_id, output_index] pairs
+        for value in workflow[node_id]["inputs"].values():
+            if isinstance(value, list) and len(value) == 2:
+                if value[0] in workflow:
+                    pending.append(value[0])
+
+    return {
+        node_id: copy.deepcopy(node)
+        for node_id, node in workflow.items()
+        if node_id in reachable
+    }
+
+
+def prompt_request_body(prompt, **fields):
+    """Body of a ComfyUI `POST /prompt` around a pre-serialized prompt"""
+    if not isinstance(prompt, bytes):
+        prompt = json.dumps(prompt).encode("utf-8")
+    body = b'{"prompt":' + prompt
+    if fields:
+        body += b"," + json.dumps(fields).encode("utf-8")[1:]
+    else:
+        body += b"}"
+    return body
@@ -1,18 +1,66 @@
 import base64
+import hashlib
 import json
 import os
+import shutil
+import tarfile
 import tempfile
+import threading
+import time
 import uuid
-from urllib import request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib import error, parse, request
 
-import websocket
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, jsonify, send_file, url_for
 from flask import request as flask_request
 from flask_cors import CORS
+from werkzeug.wsgi import ClosingIterator
+
+from src.admission import AdmissionController
+from src.backends import BackendPool
+from src.blender_pool import BlenderPool
+from src.cache import ResultCache, content_key
+from src.downloads import ConnectionPool
+from src.glb import obj_to_glb
+from src.jobs import JobManager
+from src.llm import ContextCache, OllamaClient, TokenCoalescer, replay
+from src.metrics import Registry, StageMetrics
+from src.profiling import NodeProfiler
+from src.sessions import SessionStore, estimate_tokens
+from src.workflow import WorkflowTemplate, prompt_request_body, prune_workflow
 
 
 class Wrapper:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_texture_jobs: int = 2,
+        converter: str = "python",
+        blender_pool_options: dict = None,
+        comfy_addresses: list = None,
+        max_in_flight: int = 4,
+        max_queued: int = 16,
+        deterministic: bool = False,
+        cache_dir: str = None,
+        cache_max_bytes: int = 1024**3,
+        max_batch_size: int = 64,
+        max_batch_workers: int = 4,
+        profile_path: str = None,
+        workflow_outputs: list = ("3D_SaveUVMapImage",),
+        bundle_downloads: bool = True,
+        llm_model: str = "mistral",
+        max_llm_generations: int = 4,
+        sse_coalesce_window: float = 0.04,
+        sse_coalesce_bytes: int = 4096,
+        cache_system_prompt: bool = True,
+        max_sessions: int = 1000,
+        session_ttl: int = 3600,
+        session_dir: str = None,
+        session_max_tokens: int = 3072,
+        adventure_cache_dir: str = None,
+        adventure_cache_max_bytes: int = 64 * 1024**2,
+        adventure_replay_speed: float = 1.0,
+        monitor_connect_timeout: float = 5.0,
+    ) -> None:
         self.app: Flask = Flask(__name__)
         # Add CORS support
         CORS(
@@ -25,14 +73,66 @@ class Wrapper:
                         "http://localhost:8888",
                         "http://127.0.0.1:8888",
                     ],
-                    "methods": ["POST", "OPTIONS"],
+                    "methods": ["GET", "POST", "OPTIONS"],
                     "allow_headers": ["Content-Type", "Accept"],
                 }
             },
         )
 
         self.server_address = "192.168.91.13:8188"
+        if comfy_addresses:
+            self.server_address = comfy_addresses[0]
         self.llm_address = "192.168.91.12:11434"
+        self.llm_model = llm_model
+        # Pooled Ollama connections, bounded to a few concurrent generations
+        self.llm = OllamaClient(
+            self.llm_address, max_concurrent=max_llm_generations
+        )
+        # Contexts of system prompts already evaluated by the model
+        self.llm_contexts = None
+        if cache_system_prompt:
+            self.llm_contexts = ContextCache(self.llm)
+        # Multi-turn adventures; sessions beyond `max_sessions` are spilled
+        # to `session_dir` if given, otherwise forgotten
+        self.sessions = SessionStore(
+            max_sessions=max_sessions, ttl=session_ttl, spill_dir=session_dir
+        )
+        self.session_max_tokens = session_max_tokens
+        # Completed stories of new sessions, replayed for repeated requests
+        # instead of generating again; `adventure_replay_speed` above 1
+        # compresses the original token timing, 0 sends the story at once
+        self.adventure_cache = None
+        if adventure_cache_dir is not None:
+            self.adventure_cache = ResultCache(
+                adventure_cache_dir,
+                max_bytes=adventure_cache_max_bytes,
+                suffix=".json",
+            )
+        self.adventure_replay_speed = adventure_replay_speed
+        # Story tokens are sent in frames of up to 40 ms or 4 KiB of text
+        self.sse_coalesce_window = sse_coalesce_window
+        self.sse_coalesce_bytes = sse_coalesce_bytes
+
+        # OBJ to GLB backend: "python" (in-process) or "blender"
+        self.converter = converter
+
+        # Optional warm Blender workers, e.g. {"size": 2, "timeout": 120,
+        # "max_jobs_per_worker": 50}; without it Blender runs one-shot
+        self.blender_pool = None
+        if blender_pool_options is not None:
+            self.blender_pool = BlenderPool(**blender_pool_options)
+            self.blender_pool.start()
+
+        # ComfyUI servers, each with one WebSocket shared by its prompts
+        self.backends = BackendPool(comfy_addresses or [self.server_address])
+        # How long a prompt waits for its backend's WebSocket before queueing
+        self.monitor_connect_timeout = monitor_connect_timeout
+
+        # Keep-alive connections reused by the artifact downloads
+        self.downloads = ConnectionPool()
+        # Fetch a job's artifacts as a single tar bundle when the server
+        # supports it, instead of one request per file
+        self.bundle_downloads = bundle_downloads
 
         # Load the workflow JSON file
         workflow_path: str = os.path.join(
@@ -44,6 +144,69 @@ class Wrapper:
         except Exception as e:
             print(f"Error loading workflow file: {e}")
             self.workflow = None
+        self.workflow_hash = content_key(self.workflow)
+
+        # Drop previews and other nodes whose results are never downloaded;
+        # `workflow_outputs` names the consumed outputs, None keeps the graph
+        if self.workflow is not None and workflow_outputs is not None:
+            pruned = prune_workflow(self.workflow, workflow_outputs)
+            print(
+                f"Pruned {len(self.workflow) - len(pruned)} of "
+                f"{len(self.workflow)} workflow nodes"
+            )
+            self.workflow = pruned
+
+        # Serialized once; requests only inject the fields they change
+        self.workflow_template = None
+        if self.workflow is not None:
+            self.workflow_template = WorkflowTemplate(
+                self.workflow,
+                {
+                    "text": ("4", "text"),
+                    "seed": ("9", "seed"),
+                    "mesh_file_path": ("9", "mesh_file_path"),
+                },
+            )
+
+        # Per-node execution times, persisted to `profile_path` if given
+        self.profiler = NodeProfiler(
+            self.workflow,
+            profile_path,
+            name=os.path.splitext(os.path.basename(workflow_path))[0],
+        )
+
+        # Derive seeds from the prompt so identical requests give identical
+        # results, which is what makes the result cache effective
+        self.deterministic = deterministic
+        self.result_cache = None
+        if cache_dir is not None:
+            self.result_cache = ResultCache(
+                cache_dir, max_bytes=cache_max_bytes
+            )
+
+        # Background texture jobs, bounded to a few concurrent generations
+        self.jobs = JobManager(max_workers=max_texture_jobs)
+
+        # Limits generations across the synchronous endpoint and jobs
+        self.admission = AdmissionController(
+            max_in_flight=max_in_flight, max_queued=max_queued
+        )
+
+        # Stage timings, in-flight gauges and error counters for /metrics
+        self.metrics = Registry()
+        self.stage_metrics = StageMetrics(self.metrics)
+        self.queue_gauges = {
+            name: self.metrics.gauge(f"tcp_admission_{name}", documentation)
+            for name, documentation in (
+                ("in_flight", "Texture generations holding a slot"),
+                ("queued", "Texture generations waiting for a slot"),
+            )
+        }
+
+        # Batch requests take an admission ticket per prompt and run up to
+        # `max_batch_workers` of their prompts in parallel
+        self.max_batch_size = max_batch_size
+        self.max_batch_workers = max_batch_workers
 
         @self.app.route("/api/texture", methods=["POST", "OPTIONS"])
         def texture():
@@ -53,9 +216,6 @@ class Wrapper:
                 return jsonify({"status": "ok"})
 
             try:
-                # Create unique context for this request
-                request_context = self.create_request_context()
-
                 # Get request data
                 data = flask_request.get_json()
                 user_prompt: str = data.get("user_prompt")
@@ -65,53 +225,318 @@ class Wrapper:
                     return jsonify(
                         {"error": "Missing required parameters"}
                     ), 400
+                priority = data.get("priority", "interactive")
+                if priority not in self.admission.priority_delays:
+                    return jsonify({"error": "Unknown priority"}), 400
                 if self.workflow is None:
                     return jsonify({"error": "Workflow file not loaded"}), 500
 
-                # Create a copy of the workflow to modify
-                prompt = self.workflow.copy()
+                seed = self.prompt_seed(user_prompt)
+                cache_key = self.result_cache_key(user_prompt, seed)
+                glb_data = None
+                glb_path = self.cached_result(cache_key, as_path=True)
+
+                if glb_path is None:
+                    # Wait for a generation slot, or turn the client away
+                    ticket = self.admission.admit(priority)
+                    if ticket is None:
+                        return self.queue_full_response()
+
+                    with ticket:
+                        self.record_queue_wait(ticket)
+                        # Create unique context for this request
+                        request_context = self.create_request_context()
+                        request_context["queue_number"] = ticket.rank[0]
+                        try:
+                            prompt = self.build_prompt(
+                                user_prompt, request_context, seed
+                            )
+
+                            # Step 1: Process the prompt and wait for completion
+                            print("Step 1: Processing prompt...")
+                            success = self.process_prompt(
+                                prompt, request_context
+                            )
+
+                            # Raised rather than returned, so the ticket
+                            # does not count the failure as a generation
+                            if not success:
+                                raise Exception("Prompt execution failed")
+
+                            # Step 2: Download and convert files
+                            print("Step 2: Processing files...")
+                            try:
+                                glb_data = self.process_and_convert_to_glb(
+                                    request_context
+                                )
+                            except Exception as e:
+                                raise Exception(
+                                    f"File processing failed: {str(e)}"
+                                ) from e
+                        finally:
+                            # Also drops the job's outputs on the ComfyUI side
+                            self.cleanup_context(request_context)
+
+                        self.store_result(cache_key, glb_data)
+                        if self.result_cache is not None:
+                            glb_path = self.result_cache.get_path(cache_key)
+
+                # Clients asking for model/gltf-binary get the raw GLB,
+                # streamed from the cache when possible
+                if self.wants_binary_glb():
+                    if glb_path is not None:
+                        return send_file(
+                            glb_path,
+                            mimetype="model/gltf-binary",
+                            etag=cache_key,
+                            max_age=0,
+                        )
+                    response = Response(glb_data, mimetype="model/gltf-binary")
+                    response.set_etag(hashlib.sha256(glb_data).hexdigest())
+                    return response
 
-                # Update the prompt text
-                prompt["4"]["inputs"]["text"] = (
-                    f"{user_prompt}, painting, high quality, colorful"
-                )
-                print(f"Setting prompt text: {user_prompt}")
+                if glb_data is None:
+                    with open(glb_path, "rb") as f:
+                        glb_data = f.read()
+                # Step 3: Return response
+                with self.stage_metrics.span("encode"):
+                    glb_base64 = base64.b64encode(glb_data).decode("utf-8")
+                    return jsonify(
+                        {
+                            "status": "success",
+                            "message": "Generation completed",
+                            "user_prompt": user_prompt,
+                            "glb_data": glb_base64,
+                        }
+                    )
 
-                # Update the seed
-                prompt["9"]["inputs"]["seed"] = str(uuid.uuid4().int % (2**32))
+            except Exception as e:
+                print(f"Error in texture endpoint: {str(e)}")
+                return jsonify({"error": str(e)}), 500
 
-                # Step 1: Process the prompt and wait for completion
-                print("Step 1: Processing prompt...")
-                success = self.process_prompt(prompt, request_context)
+        @self.app.route("/api/texture/batch", methods=["POST", "OPTIONS"])
+        def texture_batch():
+            """Generate several prompts and stream each GLB as it completes"""
+            if flask_request.method == "OPTIONS":
+                return jsonify({"status": "ok"})
 
-                if not success:
-                    return jsonify({"error": "Prompt execution failed"}), 500
+            data = flask_request.get_json(silent=True) or {}
+            user_prompts = data.get("prompts")
+            seeds = data.get("seeds")
 
-                # Step 2: Download and convert files
-                print("Step 2: Processing files...")
-                try:
-                    glb_data = self.process_and_convert_to_glb(request_context)
-                    glb_base64 = base64.b64encode(glb_data).decode("utf-8")
-                except Exception as e:
+            if not user_prompts or not isinstance(user_prompts, list):
+                return jsonify({"error": "Missing required parameters"}), 400
+            if not all(isinstance(p, str) and p for p in user_prompts):
+                return jsonify(
+                    {"error": "Prompts must be non-empty strings"}
+                ), 400
+            # A batch is admitted as a whole, so it must fit the queue
+            max_size = min(self.max_batch_size, self.admission.capacity)
+            if len(user_prompts) > max_size:
+                return jsonify(
+                    {"error": f"At most {max_size} prompts per batch"}
+                ), 400
+            if seeds is not None:
+                if not isinstance(seeds, list) or len(seeds) != len(
+                    user_prompts
+                ):
                     return jsonify(
-                        {"error": f"File processing failed: {str(e)}"}
-                    ), 500
+                        {"error": "Seeds must match the prompts one to one"}
+                    ), 400
+                seeds = [str(seed) for seed in seeds]
+            if self.workflow is None:
+                return jsonify({"error": "Workflow file not loaded"}), 500
+            if not self.jobs.accepting:
+                return jsonify({"error": "Server is shutting down"}), 503
+
+            priority = data.get("priority", "batch")
+            if priority not in self.admission.priority_delays:
+                return jsonify({"error": "Unknown priority"}), 400
+
+            # One ticket per prompt, all or none
+            tickets = self.admission.admit_many(len(user_prompts), priority)
+            if tickets is None:
+                return self.queue_full_response()
+
+            def generate():
+                results = self.run_texture_batch(user_prompts, tickets, seeds)
+                for index, glb_data, error in results:
+                    line = {"index": index, "user_prompt": user_prompts[index]}
+                    if error is not None:
+                        line["status"] = "error"
+                        line["error"] = error
+                        yield json.dumps(line) + "\n"
+                        continue
+                    with self.stage_metrics.span("encode"):
+                        line["status"] = "success"
+                        line["glb_data"] = base64.b64encode(glb_data).decode(
+                            "utf-8"
+                        )
+                        encoded = json.dumps(line) + "\n"
+                    yield encoded
+
+            def release():
+                # Tickets of a response closed before streaming never run
+                for ticket in tickets:
+                    ticket.cancel()
+
+            return Response(
+                ClosingIterator(generate(), [release]),
+                mimetype="application/x-ndjson",
+                headers={"Cache-Control": "no-cache"},
+            )
 
-                self.cleanup_context(request_context)
+        @self.app.route("/api/texture/jobs", methods=["POST", "OPTIONS"])
+        def submit_texture_job():
+            """Queue a texture generation and return its job id immediately"""
+            if flask_request.method == "OPTIONS":
+                return jsonify({"status": "ok"})
 
-                # Step 3: Return response
-                return jsonify(
-                    {
-                        "status": "success",
-                        "message": "Generation completed",
-                        "user_prompt": user_prompt,
-                        "glb_data": glb_base64,
-                    }
-                )
+            data = flask_request.get_json(silent=True) or {}
+            user_prompt = data.get("user_prompt")
 
-            except Exception as e:
-                print(f"Error in texture endpoint: {str(e)}")
-                return jsonify({"error": str(e)}), 500
+            if not user_prompt:
+                return jsonify({"error": "Missing required parameters"}), 400
+            if self.workflow is None:
+                return jsonify({"error": "Workflow file not loaded"}), 500
+
+            priority = data.get("priority", "interactive")
+            if priority not in self.admission.priority_delays:
+                return jsonify({"error": "Unknown priority"}), 400
+
+            seed = self.prompt_seed(user_prompt)
+            glb_data = self.cached_result(
+                self.result_cache_key(user_prompt, seed)
+            )
+            ticket = None
+            if glb_data is not None:
+                # Cache hits take no generation slot, so they do not skew
+                # the average generation time either
+                def run_cached(job):
+                    self.jobs.start(job)
+                    return glb_data
+
+                job = self.jobs.submit(user_prompt, run_cached)
+            else:
+                ticket = self.admission.admit(priority)
+                if ticket is None:
+                    return self.queue_full_response()
+
+                def run_admitted(job):
+                    # The job stays queued until it gets a generation slot
+                    with ticket:
+                        self.jobs.start(job)
+                        self.record_queue_wait(ticket)
+                        return self.run_texture_job(job, ticket.rank[0])
+
+                job = self.jobs.submit(user_prompt, run_admitted)
+
+            if job is None:
+                if ticket is not None:
+                    ticket.cancel()
+                return jsonify({"error": "Server is shutting down"}), 503
+            if ticket is not None:
+                self.jobs.update(job, ticket=ticket)
+            return jsonify(job.to_dict()), 202
+
+        @self.app.route("/api/texture/jobs/<job_id>", methods=["GET"])
+        def texture_job_status(job_id):
+            """Report the status and progress of a texture job"""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({"error": "Job not found"}), 404
+            return jsonify(job.to_dict())
+
+        @self.app.route("/api/texture/jobs/<job_id>/result", methods=["GET"])
+        def texture_job_result(job_id):
+            """Return the generated GLB of a completed texture job"""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({"error": "Job not found"}), 404
+            if job.status == "failed":
+                return jsonify({"error": job.error}), 500
+            if job.status != "completed":
+                return jsonify(job.to_dict()), 409
+            return send_file(
+                job.result_path,
+                mimetype="model/gltf-binary",
+                as_attachment=True,
+                download_name=f"{job.id}.glb",
+            )
+
+        @self.app.route("/api/texture/jobs/<job_id>/events", methods=["GET"])
+        def texture_job_events(job_id):
+            """Stream the progress of a texture job as server-sent events"""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({"error": "Job not found"}), 404
+            result_url = url_for("texture_job_result", job_id=job_id)
+
+            def generate():
+                sent = {}
+                version = None
+                idle = 0
+                while True:
+                    # Time out regularly to refresh the queue position
+                    version, state = self.jobs.wait_for_update(
+                        job, version, timeout=1
+                    )
+                    idle += 1
+                    for event in self.job_events(job, state, result_url):
+                        if sent.get(event["type"]) != event:
+                            sent[event["type"]] = event
+                            idle = 0
+                            yield f"data: {json.dumps(event)}\n\n"
+                    if state["status"] in ("completed", "failed"):
+                        return
+                    # Comment lines keep proxies from closing a quiet stream
+                    if idle >= 15:
+                        idle = 0
+                        yield ": keep-alive\n\n"
+
+            return Response(
+                generate(),
+                mimetype="text/event-stream",
+                headers={
+                    "Cache-Control": "no-cache",
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Headers": "Content-Type",
+                },
+            )
+
+        @self.app.route("/api/queue", methods=["GET"])
+        def queue_status():
+            """Report texture queue depth and the estimated wait"""
+            return jsonify(self.admission.stats())
+
+        @self.app.route("/api/backends", methods=["GET"])
+        def list_backends():
+            """Report health and queue depth of every ComfyUI backend"""
+            return jsonify(
+                [backend.to_dict() for backend in self.backends.backends]
+            )
+
+        @self.app.route("/api/profile", methods=["GET"])
+        def node_profile():
+            """Report per-node execution times, or folded flame graph stacks"""
+            if flask_request.args.get("format") == "folded":
+                return Response(self.profiler.folded(), mimetype="text/plain")
+            return jsonify(
+                {
+                    "nodes": self.profiler.stats(),
+                    "class_types": self.profiler.class_type_stats(),
+                }
+            )
+
+        @self.app.route("/metrics", methods=["GET"])
+        def metrics():
+            """Expose pipeline metrics in the Prometheus text format"""
+            stats = self.admission.stats()
+            for name, gauge in self.queue_gauges.items():
+                gauge.set(stats[name])
+            return Response(
+                self.metrics.render(), content_type=self.metrics.content_type
+            )
 
         @self.app.route("/api/adventure", methods=["POST", "OPTIONS"])
         def adventure():
@@ -125,6 +550,22 @@ class Wrapper:
                 if not user_prompt:
                     return jsonify({"error": "Missing user prompt"}), 400
 
+                # Sampling options passed through to Ollama, e.g. a seed
+                options = data.get("options") or {}
+                if not isinstance(options, dict):
+                    return jsonify({"error": "Invalid options"}), 400
+
+                # Continue an existing story, or start a new one
+                session_id = data.get("session_id")
+                if session_id is None:
+                    session = self.sessions.create(self.llm_model)
+                else:
+                    session = self.sessions.get(session_id)
+                    if session is None:
+                        return jsonify(
+                            {"error": "Unknown or expired session"}
+                        ), 404
+
                 system_prompt = """You are a masterful fantasy storyteller, crafting immersive, vivid, and emotionally compelling adventures. Your task is to generate an engaging fantasy story based on the provided main character's name. The story should be richly descriptive, full of mystery, danger, and wonder, drawing the reader into a world filled with unique landscapes, magical elements, and intriguing characters.
 
                 Guidelines:
@@ -137,45 +578,306 @@ class Wrapper:
 
                 Your goal is to **captivate and immerse** the reader, making them feel as if they are living the adventure alongside the protagonist."""
 
-                def generate():
-                    try:
-                        url = f"http://{self.llm_address}/api/generate"
-                        data = {
-                            "model": "mistral",
-                            "prompt": f"System: {system_prompt}\n\nHuman: {user_prompt}\n\nAssistant:",
-                            "stream": True,
+                # Only new stories are cached; continuations depend on the
+                # whole session
+                cache_key = None
+                if self.adventure_cache is not None and session_id is None:
+                    cache_key = self.adventure_cache_key(
+                        system_prompt, user_prompt, options
+                    )
+                    record = self.cached_adventure(cache_key)
+                    if record is not None:
+                        return self.adventure_response(
+                            self.replay_adventure(record, session, user_prompt),
+                            session,
+                        )
+
+                payload = self.adventure_payload(
+                    session, user_prompt, system_prompt
+                )
+                if options:
+                    payload["options"] = options
+                stream = self.llm.generate(payload)
+                if stream is None:
+                    response = jsonify(
+                        {
+                            "error": "Too many stories in progress, try again later"
                         }
+                    )
+                    response.status_code = 429
+                    response.headers["Retry-After"] = "5"
+                    return response
 
-                        # Make request using urllib
-                        req = request.Request(
-                            url,
-                            data=json.dumps(data).encode("utf-8"),
-                            headers={"Content-Type": "application/json"},
+                def generate():
+                    try:
+                        coalescer = TokenCoalescer(
+                            self.sse_coalesce_window, self.sse_coalesce_bytes
                         )
-
-                        with request.urlopen(req) as response:
-                            for line in response:
-                                if line:
-                                    json_response = json.loads(line.decode())
-                                    if "response" in json_response:
-                                        yield f"data: {json.dumps({'text': json_response['response']})}\n\n"
+                        started = time.monotonic()
+                        frames = []
+                        for frame in coalescer.frames(stream):
+                            if cache_key is not None:
+                                offset = time.monotonic() - started
+                                frames.append([offset, frame.decode("utf-8")])
+                            yield frame
+
+                        final = coalescer.final or {}
+                        if "context" in final:
+                            story = coalescer.text()
+                            session.add_turn(
+                                user_prompt, story, final["context"]
+                            )
+                            self.sessions.save(session)
+                            if cache_key is not None:
+                                self.store_adventure(
+                                    cache_key,
+                                    {
+                                        "frames": frames,
+                                        "story": story,
+                                        "context": final["context"],
+                                    },
+                                )
 
                     except Exception as e:
                         yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
-                return Response(
-                    generate(),
-                    mimetype="text/event-stream",
-                    headers={
-                        "Cache-Control": "no-cache",
-                        "Access-Control-Allow-Origin": "*",
-                        "Access-Control-Allow-Headers": "Content-Type",
-                    },
+                # Closing the response when the client goes away also aborts
+                # the upstream generation
+                return self.adventure_response(
+                    ClosingIterator(generate(), [stream.close]), session
                 )
 
             except Exception as e:
                 return jsonify({"error": str(e)}), 500
 
+    def adventure_response(self, body, session):
+        """SSE response streaming `body`, a story of `session`"""
+        return Response(
+            body,
+            mimetype="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Headers": "Content-Type",
+                "Access-Control-Expose-Headers": "X-Session-Id",
+                "X-Session-Id": session.id,
+            },
+        )
+
+    def adventure_cache_key(self, system_prompt, user_prompt, options):
+        """Content address of the story generated for a new session"""
+        return content_key(
+            self.llm_model,
+            hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+            user_prompt,
+            options,
+        )
+
+    def cached_adventure(self, cache_key):
+        """Recorded story for `cache_key`, or None"""
+        data = self.adventure_cache.get(cache_key)
+        if data is None:
+            return None
+        try:
+            record = json.loads(data)
+        except ValueError as e:
+            print(f"Error reading cached adventure: {e}")
+            return None
+        print(f"Adventure cache hit: {cache_key}")
+        return record
+
+    def store_adventure(self, cache_key, record):
+        try:
+            self.adventure_cache.put(
+                cache_key, json.dumps(record).encode("utf-8")
+            )
+        except Exception as e:
+            print(f"Error storing adventure in cache: {e}")
+
+    def replay_adventure(self, record, session, user_prompt):
+        """Send a recorded story and start the session from its context"""
+        frames = [
+            (offset, frame.encode("utf-8"))
+            for offset, frame in record["frames"]
+        ]
+        yield from replay(frames, self.adventure_replay_speed)
+        session.add_turn(user_prompt, record["story"], record["context"])
+        self.sessions.save(session)
+
+    def adventure_payload(self, session, user_prompt, system_prompt):
+        """Generate request continuing `session` with a new user turn"""
+        payload = {"model": self.llm_model, "prompt": user_prompt}
+        if (
+            session.context is not None
+            and session.model == self.llm_model
+            and len(session.context) + estimate_tokens(user_prompt)
+            <= self.session_max_tokens
+        ):
+            payload["context"] = session.context
+            return payload
+
+        payload.update(self.system_prompt_fields(system_prompt))
+        transcript = session.transcript(self.session_max_tokens // 2)
+        if transcript:
+            payload["prompt"] = f"{transcript}\n\nHuman: {user_prompt}"
+        session.model = self.llm_model
+        return payload
+
+    def system_prompt_fields(self, system_prompt):
+        """Generate fields applying `system_prompt`, cached when possible"""
+        if self.llm_contexts is not None:
+            # None while priming is pending or failing
+            context = self.llm_contexts.get(self.llm_model, system_prompt)
+            if context is not None:
+                return {"context": context}
+        return {"system": system_prompt}
+
+    def job_events(self, job, state, result_url):
+        """Events describing the current state of a job, one per type"""
+        events = []
+        if state["status"] == "queued" and job.ticket is not None:
+            position = self.admission.position(job.ticket)
+            if position is not None:
+                events.append({"type": "queue", "position": position})
+
+        events.append(
+            {
+                "type": "status",
+                "status": state["status"],
+                "stage": state["stage"],
+                "node": state["node"],
+            }
+        )
+        if state["step"] is not None:
+            value, maximum = state["step"]
+            events.append(
+                {
+                    "type": "progress",
+                    "node": state["node"],
+                    "value": value,
+                    "max": maximum,
+                }
+            )
+
+        if state["status"] == "completed":
+            events.append({"type": "completed", "result_url": result_url})
+        elif state["status"] == "failed":
+            events.append({"type": "failed", "error": state["error"]})
+        return events
+
+    def record_queue_wait(self, ticket):
+        """Record how long an admitted request waited for its slot"""
+        self.stage_metrics.seconds.observe(
+            ticket.started_at - ticket.admitted_at, stage="queue_wait"
+        )
+
+    def prompt_seed(self, user_prompt):
+        """Random seed, or one derived from the prompt in deterministic mode"""
+        if self.deterministic:
+            digest = content_key(self.workflow_hash, user_prompt)
+            return str(int(digest[:8], 16))
+        return str(uuid.uuid4().int % (2**32))
+
+    def result_cache_key(self, user_prompt, seed):
+        """Content address of the GLB produced for a prompt and seed"""
+        return content_key(
+            self.workflow_hash,
+            self.prompt_text(user_prompt),
+            seed,
+            self.workflow["9"]["inputs"]["mesh_file_path"],
+        )
+
+    def queue_full_response(self):
+        """429 telling the client when a queue slot should be free again"""
+        response = jsonify(
+            {
+                "error": "Too many texture requests, try again later",
+                **self.admission.stats(),
+            }
+        )
+        response.status_code = 429
+        response.headers["Retry-After"] = str(self.admission.retry_after())
+        return response
+
+    def wants_binary_glb(self):
+        """Whether the client prefers a raw GLB over the JSON/base64 body"""
+        best = flask_request.accept_mimetypes.best_match(
+            ["application/json", "model/gltf-binary"]
+        )
+        return best == "model/gltf-binary"
+
+    def cached_result(self, cache_key, as_path=False):
+        """Cached GLB bytes for `cache_key`, or its path with `as_path`"""
+        if self.result_cache is None:
+            return None
+        if as_path:
+            result = self.result_cache.get_path(cache_key)
+        else:
+            result = self.result_cache.get(cache_key)
+        if result is not None:
+            print(f"Result cache hit: {cache_key}")
+        return result
+
+    def store_result(self, cache_key, glb_data):
+        if self.result_cache is None:
+            return
+        try:
+            self.result_cache.put(cache_key, glb_data)
+        except Exception as e:
+            print(f"Error storing result in cache: {e}")
+
+    def prompt_text(self, user_prompt):
+        return f"{user_prompt}, painting, high quality, colorful"
+
+    def build_prompt(self, user_prompt, context=None, seed=None):
+        """Render the serialized prompt for the user prompt and seed"""
+        values = {"text": self.prompt_text(user_prompt)}
+        print(f"Setting prompt text: {user_prompt}")
+
+        if seed is None:
+            seed = self.prompt_seed(user_prompt)
+        values["seed"] = seed
+
+        # Point the mesh at a job-scoped copy so Paint3D writes its outputs
+        # into a directory no other job uses
+        if context is not None and "prompt_id" in context:
+            values["mesh_file_path"] = self.job_mesh_path(context["prompt_id"])
+
+        return self.workflow_template.render(**values)
+
+    def job_mesh_path(self, prompt_id):
+        """Path of the per-job mesh copy staged by the patched ComfyUI server"""
+        mesh_path = self.workflow["9"]["inputs"]["mesh_file_path"]
+        return os.path.join(
+            os.path.dirname(mesh_path),
+            "jobs",
+            prompt_id,
+            os.path.basename(mesh_path),
+        )
+
+    def run_texture_job(self, job, queue_number=None):
+        """Run the full texture pipeline for a background job"""
+        seed = self.prompt_seed(job.user_prompt)
+        cache_key = self.result_cache_key(job.user_prompt, seed)
+        request_context = self.create_request_context()
+        if queue_number is not None:
+            request_context["queue_number"] = queue_number
+
+        def progress(stage, node=None, step=None):
+            self.jobs.update(job, stage=stage, node=node, step=step)
+
+        try:
+            prompt = self.build_prompt(job.user_prompt, request_context, seed)
+            if not self.process_prompt(prompt, request_context, progress):
+                raise Exception("Prompt execution failed")
+
+            progress("converting")
+            glb_data = self.process_and_convert_to_glb(request_context)
+            self.store_result(cache_key, glb_data)
+            return glb_data
+        finally:
+            self.cleanup_context(request_context)
+
     def cleanup_context(self, context):
         """Clean up request-specific resources"""
         try:
@@ -186,15 +888,35 @@ class Wrapper:
         except Exception as e:
             print(f"Error cleaning up context: {e}")
 
+        # Drop the job-scoped output directory on the ComfyUI side
+        if "prompt_id" in context:
+            try:
+                server_address = context.get(
+                    "server_address", self.server_address
+                )
+                url = f"http://{server_address}/download"
+                req = request.Request(
+                    f"{url}/{context['prompt_id']}", method="DELETE"
+                )
+                request.urlopen(req, timeout=10)
+            except Exception as e:
+                print(f"Error cleaning up job outputs: {e}")
+
     def create_request_context(self):
         """Create a unique context for each request"""
-        return {"temp_dir": tempfile.mkdtemp(), "client_id": str(uuid.uuid4())}
+        return {"temp_dir": tempfile.mkdtemp(), "prompt_id": str(uuid.uuid4())}
 
     def queue_prompt(self, prompt, context):
         """Queue a prompt to ComfyUI"""
-        p = {"prompt": prompt, "client_id": context["client_id"]}
-        data = json.dumps(p).encode("utf-8")
-        req = request.Request(f"http://{self.server_address}/prompt", data=data)
+        server_address = context.get("server_address", self.server_address)
+        fields = {"client_id": context.get("client_id", "")}
+        if "prompt_id" in context:
+            fields["prompt_id"] = context["prompt_id"]
+        # ComfyUI runs lower numbers first
+        if "queue_number" in context:
+            fields["number"] = context["queue_number"]
+        data = prompt_request_body(prompt, **fields)
+        req = request.Request(f"http://{server_address}/prompt", data=data)
         return json.loads(request.urlopen(req).read())
 
     def verify_execution(self, ws, prompt_id):
@@ -244,61 +966,94 @@ class Wrapper:
             "texture": "albedo.png",
         }
 
-        file_paths = {}
+        # Job-scoped outputs live under the prompt id on the server
+        download_path = "/download"
+        if "prompt_id" in context:
+            download_path += f"/{context['prompt_id']}"
 
-        for file_type, filename in files.items():
+        server_address = context.get("server_address", self.server_address)
+
+        if self.bundle_downloads and "prompt_id" in context:
             try:
-                url = f"http://{self.server_address}/download/{filename}"
-                response = request.urlopen(url)
+                with self.stage_metrics.span("download"):
+                    return self.download_bundle(
+                        server_address, download_path, files, context
+                    )
+            except Exception as e:
+                print(f"Bundle download failed, fetching files one by one: {e}")
 
-                # Save to temporary directory
-                save_path = os.path.join(context["temp_dir"], filename)
+        def download(filename):
+            save_path = os.path.join(context["temp_dir"], filename)
+            size, elapsed = self.downloads.download(
+                server_address, f"{download_path}/{filename}", save_path
+            )
+            print(f"Downloaded {filename}: {size} bytes in {elapsed:.3f}s")
+            return save_path, elapsed
 
-                with open(save_path, "wb") as f:
-                    f.write(response.read())
+        file_paths = {}
+        context["download_timings"] = {}
+
+        with (
+            self.stage_metrics.span("download"),
+            ThreadPoolExecutor(max_workers=len(files)) as executor,
+        ):
+            futures = {
+                file_type: executor.submit(download, filename)
+                for file_type, filename in files.items()
+            }
+            for file_type, future in futures.items():
+                try:
+                    save_path, elapsed = future.result()
+                    file_paths[file_type] = save_path
+                    context["download_timings"][files[file_type]] = elapsed
+                except Exception as e:
+                    print(f"Error downloading {files[file_type]}: {e}")
+                    self.stage_metrics.error("download")
+                    file_paths[file_type] = None
 
-                file_paths[file_type] = save_path
+        return file_paths
 
-            except Exception as e:
-                print(f"Error downloading {filename}: {e}")
-                file_paths[file_type] = None
+    def download_bundle(self, server_address, download_path, files, context):
+        """Fetch the job's files as a single tar archive and unpack them"""
+        names = parse.quote(",".join(files.values()), safe=",")
+        bundle_path = os.path.join(context["temp_dir"], "bundle.tar")
+        size, elapsed = self.downloads.download(
+            server_address, f"{download_path}/bundle?files={names}", bundle_path
+        )
+        print(f"Downloaded bundle: {size} bytes in {elapsed:.3f}s")
 
+        file_paths = {}
+        with tarfile.open(bundle_path) as tar:
+            for file_type, filename in files.items():
+                save_path = os.path.join(context["temp_dir"], filename)
+                # Only the expected names are written, never archive paths
+                with tar.extractfile(filename) as source:
+                    with open(save_path, "wb") as f:
+                        shutil.copyfileobj(source, f)
+                file_paths[file_type] = save_path
+        os.remove(bundle_path)
+
+        context["download_timings"] = {"bundle": elapsed}
         return file_paths
 
     def process_and_convert_to_glb(self, context):
-        """Alternative method that uses external shell script to convert OBJ to GLB"""
+        """Download the generated files and convert the OBJ to GLB"""
         files = self.download_files(context)
 
         try:
-            # Call the external conversion script
-            obj_path = files["obj"]
-            conversion_script = "scripts/obj_gltf.sh"
-
-            # Make sure the script is executable
-            os.chmod(conversion_script, 0o755)
+            with self.stage_metrics.span("conversion"):
+                obj_path = files["obj"]
 
-            # Run the conversion script with temp directory
-            import subprocess
-
-            result = subprocess.run(
-                [conversion_script, obj_path, context["temp_dir"]],
-                capture_output=True,
-                text=True,
-            )
-
-            if result.returncode != 0:
-                raise Exception(f"Conversion script failed: {result.stderr}")
-
-            gltf_path = os.path.join(
-                context["temp_dir"],
-                os.path.splitext(os.path.basename(obj_path))[0] + ".glb",
-            )
-
-            # Read the generated GLTF file
-            with open(gltf_path, "rb") as f:
-                gltf_data = f.read()
+                if self.converter == "python":
+                    try:
+                        return obj_to_glb(obj_path)
+                    except Exception as e:
+                        print(
+                            f"In-process GLB conversion failed, "
+                            f"falling back to Blender: {str(e)}"
+                        )
 
-            return gltf_data
+                return self.convert_with_blender(obj_path, context)
 
         except Exception as e:
             print(f"Detailed error in GLTF conversion: {str(e)}")
@@ -307,60 +1062,232 @@ class Wrapper:
             print(f"Traceback: {traceback.format_exc()}")
             raise Exception(f"Error converting to GLTF: {str(e)}")
 
-    def process_prompt(self, prompt, context):
-        """Process the prompt and verify execution"""
+    def convert_with_blender(self, obj_path, context):
+        """Convert OBJ to GLB with Blender"""
+        if self.blender_pool is not None and self.blender_pool.healthy:
+            try:
+                glb_path = self.blender_pool.convert(
+                    os.path.abspath(obj_path),
+                    os.path.abspath(context["temp_dir"]),
+                )
+                with open(glb_path, "rb") as f:
+                    return f.read()
+            except Exception as e:
+                print(
+                    f"Blender pool conversion failed, "
+                    f"falling back to one-shot script: {str(e)}"
+                )
+
+        conversion_script = "scripts/obj_gltf.sh"
+
+        # Make sure the script is executable
+        os.chmod(conversion_script, 0o755)
+
+        # Run the conversion script with temp directory
+        import subprocess
+
+        result = subprocess.run(
+            [conversion_script, obj_path, context["temp_dir"]],
+            capture_output=True,
+            text=True,
+        )
+
+        if result.returncode != 0:
+            raise Exception(f"Conversion script failed: {result.stderr}")
+
+        gltf_path = os.path.join(
+            context["temp_dir"],
+            os.path.splitext(os.path.basename(obj_path))[0] + ".glb",
+        )
+
+        # Read the generated GLTF file
+        with open(gltf_path, "rb") as f:
+            gltf_data = f.read()
+
+        return gltf_data
+
+    def prompt_message_handler(self, progress):
+        """Monitor callback logging a prompt's events and reporting progress"""
+
+        def handle_message(message):
+            print(f"Received message: {message}")
+            if message["type"] == "execution_start":
+                print("Execution started")
+                progress("executing")
+            elif message["type"] == "executing":
+                node = message["data"].get("node")
+                if node:
+                    print(f"Processing node: {node}")
+                    progress("executing", node)
+                else:
+                    print("Final node reached")
+                    progress("downloading")
+            elif message["type"] == "progress":
+                data = message["data"]
+                progress(
+                    "executing", data.get("node"), [data["value"], data["max"]]
+                )
+            elif message["type"] == "execution_error":
+                error = message["data"].get("error", "Unknown error")
+                print(f"Execution failed: {error}")
+            elif message["type"] == "execution_success":
+                print("Execution completed successfully")
+
+        return handle_message
+
+    def submit_prompt(self, prompt, context, on_message=None):
+        """Queue a prompt on the least-loaded backend and start watching it"""
+        timer = self.profiler.timer()
+
+        def handle_message(message):
+            timer.handle(message)
+            if on_message is not None:
+                on_message(message)
+
+        # Route the prompt to the least-loaded ComfyUI server; the rest of
+        # the pipeline talks to the same server through the context
+        self.backends.start()
+        backend = self.backends.acquire()
         try:
+            context["server_address"] = backend.address
+            context["client_id"] = backend.monitor.client_id
+
+            # Listen before queueing, so the server knows our client id and
+            # sends the prompt's events to us from the start
+            backend.monitor.start()
+            if not backend.monitor.connected.wait(self.monitor_connect_timeout):
+                print(f"WebSocket to {backend.address} not connected yet")
+
             # First, queue the prompt and get prompt_id
-            print("Queueing prompt...")
-            queue_response = self.queue_prompt(prompt, context)
+            print(f"Queueing prompt on {backend.address}...")
+            try:
+                with self.stage_metrics.span("queue_prompt"):
+                    queue_response = self.queue_prompt(prompt, context)
+            except error.HTTPError as e:
+                # A rejected prompt says nothing about the server's health
+                if e.code >= 500:
+                    self.backends.record_failure(backend)
+                raise
+            except OSError:
+                self.backends.record_failure(backend)
+                raise
+            self.backends.record_success(backend)
             prompt_id = queue_response["prompt_id"]
             print(f"Prompt queued with ID: {prompt_id}")
 
-            # Then connect to websocket to monitor execution
-            ws = websocket.WebSocket()
-            ws.settimeout(300)  # 5 minutes timeout
-            ws.connect(
-                f"ws://{self.server_address}/ws?clientId={context['client_id']}"
-            )
+            # Events are received by the shared monitor connection and
+            # dispatched to us by prompt_id
+            return backend, backend.monitor.watch(prompt_id, handle_message)
+        except Exception:
+            self.backends.release(backend)
+            raise
 
-            # Wait for execution to complete
+    def wait_for_prompt(self, backend, watch):
+        """Block until a submitted prompt finishes; returns its success"""
+        try:
             print("Waiting for execution to complete...")
-            while True:
-                out = ws.recv()
-                if isinstance(out, str):
-                    message = json.loads(out)
-                    print(f"Received message: {message}")
-
-                    # Check if this message is relevant to our prompt
-                    if "data" in message and "prompt_id" in message["data"]:
-                        if message["data"]["prompt_id"] == prompt_id:
-                            # Handle different message types
-                            if message["type"] == "execution_start":
-                                print("Execution started")
-                            elif message["type"] == "executing":
-                                node = message["data"].get("node")
-                                if node:
-                                    print(f"Processing node: {node}")
-                                else:
-                                    print("Final node reached")
-                            elif message["type"] == "execution_error":
-                                error = message["data"].get(
-                                    "error", "Unknown error"
-                                )
-                                print(f"Execution failed: {error}")
-                                return False
-                            elif message["type"] == "execution_success":
-                                print("Execution completed successfully")
-                                return True
+            with self.stage_metrics.span("execution"):
+                success = backend.monitor.wait(watch, timeout=300)  # 5 minutes
+            if not success:
+                self.stage_metrics.error("execution")
+            else:
+                # Persisted here rather than on the monitor's receive thread
+                self.profiler.save()
+            return success
+        finally:
+            self.backends.release(backend)
+
+    def process_prompt(self, prompt, context, progress=None):
+        """Process the prompt and verify execution"""
+        if progress is None:
+            progress = lambda stage, node=None, step=None: None
 
+        try:
+            backend, watch = self.submit_prompt(
+                prompt, context, self.prompt_message_handler(progress)
+            )
+            return self.wait_for_prompt(backend, watch)
         except Exception as e:
             print(f"Error in process_prompt: {str(e)}")
             return False
+
+    def run_texture_batch(self, user_prompts, tickets, seeds=None):
+        """Generate several prompts, yielding `(index, glb_data, error)`"""
+        ignore_progress = lambda stage, node=None, step=None: None
+        stopped = threading.Event()
+
+        ready = []
+        pending = {}
+        for index, user_prompt in enumerate(user_prompts):
+            seed = seeds[index] if seeds else self.prompt_seed(user_prompt)
+            cache_key = self.result_cache_key(user_prompt, seed)
+            glb_data = self.cached_result(cache_key)
+            if glb_data is not None:
+                tickets[index].cancel()
+                ready.append((index, glb_data, None))
+                continue
+            pending[index] = (user_prompt, seed, cache_key)
+
+        def run(index):
+            user_prompt, seed, cache_key = pending[index]
+            ticket = tickets[index]
+            with ticket:
+                # Fails the ticket rather than timing an empty generation
+                if stopped.is_set():
+                    raise Exception("Batch abandoned")
+                self.record_queue_wait(ticket)
+                context = self.create_request_context()
+                # Keep the batch's own order within its place in the queue
+                context["queue_number"] = ticket.rank[0] + index * 1e-3
+                try:
+                    prompt = self.build_prompt(user_prompt, context, seed)
+                    try:
+                        backend, watch = self.submit_prompt(
+                            prompt,
+                            context,
+                            self.prompt_message_handler(ignore_progress),
+                        )
+                    except Exception as e:
+                        raise Exception(f"Prompt submission failed: {e}") from e
+                    if not self.wait_for_prompt(backend, watch):
+                        raise Exception("Prompt execution failed")
+                    glb_data = self.process_and_convert_to_glb(context)
+                    self.store_result(cache_key, glb_data)
+                    return glb_data
+                finally:
+                    self.cleanup_context(context)
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_batch_workers,
+            thread_name_prefix="texture-batch",
+        )
+        futures = {executor.submit(run, index): index for index in pending}
+        try:
+            yield from ready
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, str(e)
         finally:
-            try:
-                ws.close()
-            except:
-                pass
+            stopped.set()
+            for future, index in futures.items():
+                if future.cancel():
+                    tickets[index].cancel()
+            executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """Drain in-flight texture jobs and release background resources"""
+        in_flight = self.jobs.in_flight
+        if in_flight:
+            print(f"Waiting for {in_flight} texture jobs to finish...")
+        self.jobs.shutdown(wait=True)
+        self.backends.stop()
+        self.downloads.close()
+        self.llm.close()
+        self.sessions.close()
+        if self.blender_pool is not None:
+            self.blender_pool.shutdown()
 
     def run(self, host="0.0.0.0", port=5000, debug=True):
         self.app.run(host=host, port=port, debug=debug)
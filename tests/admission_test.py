@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+from src.admission import AdmissionController
+
+
+def test_admit_until_queue_full():
+    """Test that admission stops once running and queued slots are taken"""
+    controller = AdmissionController(max_in_flight=1, max_queued=1)
+
+    running = controller.admit()
+    queued = controller.admit()
+    assert running is not None and queued is not None
+    assert controller.admit() is None
+
+    queued.cancel()
+    assert controller.admit() is not None
+
+
+def test_queued_ticket_waits_for_slot():
+    """Test that a queued ticket only starts after a running one finishes"""
+    controller = AdmissionController(max_in_flight=1, max_queued=1)
+    first = controller.admit()
+    second = controller.admit()
+    started = threading.Event()
+
+    def run_second():
+        with second:
+            started.set()
+
+    with first:
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        assert not started.wait(0.2)
+        assert controller.stats()["queued"] == 1
+
+    thread.join(timeout=5)
+    assert started.is_set()
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_wait_estimates_follow_durations():
+    """Test that wait estimates use the observed job duration"""
+    controller = AdmissionController(
+        max_in_flight=2, max_queued=4, initial_duration=100
+    )
+    assert controller.estimated_wait() == 0
+
+    tickets = [controller.admit() for _ in range(3)]
+    assert controller.estimated_wait() == 100
+    assert controller.retry_after() == 50
+
+    with tickets[0]:
+        pass
+    assert controller.average_duration < 100
+
+
+def test_interactive_overtakes_batch():
+    """Test that a waiting interactive ticket starts before a batch one"""
+    controller = AdmissionController(max_in_flight=1, max_queued=2)
+    running = controller.admit()
+    batch = controller.admit("batch")
+    interactive = controller.admit("interactive")
+    order = []
+
+    def run(ticket, name):
+        with ticket:
+            order.append(name)
+
+    with running:
+        threads = [
+            threading.Thread(target=run, args=(batch, "batch")),
+            threading.Thread(target=run, args=(interactive, "interactive")),
+        ]
+        for thread in threads:
+            thread.start()
+        while len(controller.waiters) < 2:
+            pass
+
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["interactive", "batch"]
+
+
+def test_batch_rank_is_bounded():
+    """Test that the batch lane delay bounds how long it can be overtaken"""
+    controller = AdmissionController(
+        priority_delays={"interactive": 0, "batch": 0}
+    )
+    batch = controller.admit("batch")
+    interactive = controller.admit("interactive")
+
+    assert batch.rank < interactive.rank
+
+
+def test_queue_position():
+    """Test that positions count the queued tickets ranked ahead"""
+    controller = AdmissionController(max_in_flight=1, max_queued=4)
+    first = controller.admit()
+    batch = controller.admit("batch")
+    interactive = controller.admit()
+
+    assert controller.position(interactive) == 1
+    assert controller.position(batch) == 2
+
+    with first:
+        assert controller.position(first) is None
+        assert controller.position(interactive) == 0
+
+
+def test_admit_many_is_all_or_nothing():
+    """Test that several tickets are only admitted if they all fit"""
+    controller = AdmissionController(max_in_flight=1, max_queued=2)
+    assert controller.admit_many(4) is None
+    assert controller.stats()["queued"] == 0
+
+    tickets = controller.admit_many(3, "batch")
+    assert [ticket.rank[0] for ticket in tickets] == [tickets[0].rank[0]] * 3
+    assert tickets == sorted(tickets, key=lambda ticket: ticket.rank)
+    assert controller.admit() is None
+
+    # A cancelled ticket gives its slot back and can no longer run
+    tickets[2].cancel()
+    assert controller.stats()["queued"] == 2
+    with pytest.raises(RuntimeError):
+        with tickets[2]:
+            pass
@@ -0,0 +1,57 @@
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from src.backends import BackendPool
+
+
+def test_acquire_least_loaded_backend():
+    """Test routing to the backend with the shortest queue"""
+    pool = BackendPool(["a:8188", "b:8188"])
+    a, b = pool.backends
+
+    a.monitor.dispatch(
+        {
+            "type": "status",
+            "data": {"status": {"exec_info": {"queue_remaining": 3}}},
+        }
+    )
+    assert a.queue_remaining == 3
+
+    assert pool.acquire() is b
+    assert pool.acquire() is b
+    assert b.in_flight == 2
+
+    b.monitor.dispatch(
+        {
+            "type": "status",
+            "data": {"status": {"exec_info": {"queue_remaining": 4}}},
+        }
+    )
+    assert pool.acquire() is a
+
+
+def test_unhealthy_backend_ejected_and_readmitted():
+    """Test that failing backends stop receiving prompts until they recover"""
+    pool = BackendPool(["a:8188"], max_failures=2)
+    backend = pool.backends[0]
+
+    with patch("urllib.request.urlopen", side_effect=Exception("down")):
+        pool.check(backend)
+        pool.check(backend)
+
+    assert not backend.healthy
+    with pytest.raises(Exception, match="No healthy ComfyUI backend"):
+        pool.acquire()
+
+    response = Mock()
+    response.read.return_value = json.dumps(
+        {"queue_running": [[0]], "queue_pending": [[1], [2]]}
+    )
+    with patch("urllib.request.urlopen", return_value=response):
+        assert pool.check(backend)
+
+    assert backend.healthy
+    assert backend.queue_remaining == 3
+    assert pool.acquire() is backend
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+from src.blender_pool import BlenderPool, ConversionError
+
+FAKE_BLENDER = """#!{python}
+import json
+import os
+import sys
+import time
+
+print("Blender 4.0 (fake)", flush=True)
+print("TCP-RESULT " + json.dumps({{"status": "ready"}}), flush=True)
+for line in sys.stdin:
+    job = json.loads(line)
+    if job["obj_path"].endswith("slow.obj"):
+        time.sleep(30)
+    if job["obj_path"].endswith("bad.obj"):
+        result = {{"status": "error", "error": "bad mesh"}}
+    else:
+        glb_path = os.path.join(job["output_dir"], "out.glb")
+        result = {{"status": "ok", "glb_path": glb_path, "pid": os.getpid()}}
+    print("TCP-RESULT " + json.dumps(result), flush=True)
+"""
+
+
+@pytest.fixture
+def fake_blender(tmp_path):
+    path = tmp_path / "blender"
+    path.write_text(FAKE_BLENDER.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return str(path)
+
+
+def test_workers_are_reused_and_recycled(fake_blender, tmp_path):
+    """Test that a warm worker serves several jobs before being recycled"""
+    pool = BlenderPool(size=1, max_jobs_per_worker=2, blender=fake_blender)
+    pool.start()
+    first = pool.idle.queue[0]
+
+    assert pool.convert("a.obj", str(tmp_path)) == str(tmp_path / "out.glb")
+    assert pool.idle.queue[0] is first
+    pool.convert("b.obj", str(tmp_path))
+
+    # Recycled after max_jobs_per_worker conversions
+    assert pool.idle.empty()
+    assert not first.alive
+    pool.convert("c.obj", str(tmp_path))
+    assert pool.idle.queue[0] is not first
+    pool.shutdown()
+
+
+def test_conversion_error_keeps_worker(fake_blender, tmp_path):
+    """Test that a bad input does not count against the pool health"""
+    pool = BlenderPool(size=1, blender=fake_blender)
+    pool.start()
+
+    with pytest.raises(ConversionError, match="bad mesh"):
+        pool.convert("bad.obj", str(tmp_path))
+
+    assert pool.failures == 0
+    assert pool.idle.queue[0].alive
+    pool.shutdown()
+
+
+def test_timeouts_mark_pool_unhealthy(fake_blender, tmp_path):
+    """Test that timed out workers are killed and the pool turns unhealthy"""
+    pool = BlenderPool(
+        size=1, timeout=0.5, max_failures=1, blender=fake_blender
+    )
+    pool.start()
+    worker = pool.idle.queue[0]
+
+    with pytest.raises(TimeoutError):
+        pool.convert("slow.obj", str(tmp_path))
+
+    assert not worker.alive
+    assert not pool.healthy
@@ -0,0 +1,41 @@
+from src.cache import ResultCache, content_key
+
+
+def test_content_key_is_stable():
+    """Test that keys only depend on the content of their parts"""
+    assert content_key({"a": 1, "b": 2}, "x") == content_key(
+        {"b": 2, "a": 1}, "x"
+    )
+    assert content_key("x", 1) != content_key("x", "1")
+
+
+def test_lru_eviction_by_size(tmp_path):
+    """Test that the least recently used entries are evicted first"""
+    cache = ResultCache(str(tmp_path), max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    cache.put("c", b"1234")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert not (tmp_path / "b.glb").exists()
+    assert cache.total_bytes == 8
+
+
+def test_entries_survive_restart(tmp_path):
+    """Test that cached files on disk are reused by a new cache instance"""
+    ResultCache(str(tmp_path)).put("a", b"glb")
+
+    assert ResultCache(str(tmp_path)).get("a") == b"glb"
+
+
+def test_custom_suffix(tmp_path):
+    """Test that caches with different suffixes ignore each other's files"""
+    cache = ResultCache(str(tmp_path), suffix=".json")
+    cache.put("a", b"{}")
+    assert (tmp_path / "a.json").exists()
+    assert ResultCache(str(tmp_path), suffix=".json").get("a") == b"{}"
+    assert ResultCache(str(tmp_path)).get("a") is None
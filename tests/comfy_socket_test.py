@@ -0,0 +1,67 @@
+from src.comfy_socket import ComfyMonitor
+
+
+def test_dispatch_routes_by_prompt_id():
+    """Test that events only resolve the watch of their own prompt"""
+    monitor = ComfyMonitor("localhost:8188")
+    first = monitor.watch("first")
+    second = monitor.watch("second")
+
+    monitor.dispatch(
+        {"type": "execution_success", "data": {"prompt_id": "second"}}
+    )
+
+    assert not first.finished.is_set()
+    assert second.finished.is_set()
+    assert second.success
+
+
+def test_buffered_events_replayed_on_watch():
+    """Test that events received before registration are not lost"""
+    monitor = ComfyMonitor("localhost:8188")
+    monitor.dispatch(
+        {
+            "type": "execution_error",
+            "data": {"prompt_id": "early", "error": "Test error"},
+        }
+    )
+
+    messages = []
+    watch = monitor.watch("early", messages.append)
+
+    assert len(messages) == 1
+    # Stamped when dispatched, not when replayed
+    assert messages[0]["received_at"] <= watch.last_activity
+    assert not monitor.wait(watch)
+    assert watch.error == "Test error"
+    assert "early" not in monitor.watches
+
+
+def test_status_keeps_queued_prompts_alive():
+    """Test that queue status events count as activity until a prompt starts"""
+    monitor = ComfyMonitor("localhost:8188")
+    queued = monitor.watch("queued")
+    running = monitor.watch("running")
+    monitor.dispatch(
+        {"type": "execution_start", "data": {"prompt_id": "running"}}
+    )
+    queued.last_activity = running.last_activity = 0
+
+    monitor.dispatch(
+        {
+            "type": "status",
+            "data": {"status": {"exec_info": {"queue_remaining": 2}}},
+        }
+    )
+
+    assert queued.last_activity > 0
+    assert running.last_activity == 0
+
+
+def test_monitor_opts_out_of_previews():
+    """Test that the monitor asks the server to skip preview images"""
+    monitor = ComfyMonitor("localhost:8188")
+    assert monitor.url().endswith(f"clientId={monitor.client_id}&previews=0")
+
+    monitor = ComfyMonitor("localhost:8188", previews=True)
+    assert "previews" not in monitor.url()
@@ -0,0 +1,62 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.downloads import ConnectionPool
+
+BODY = b"x" * 200_000
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = BODY[:1000] if self.path == "/truncated" else BODY
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == "/truncated":
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_download_streams_and_reuses_connection(server, tmp_path):
+    """Test that files are written in full and the connection is kept"""
+    pool = ConnectionPool()
+
+    for name in ("a.bin", "b.bin"):
+        size, elapsed = pool.download(server, "/file", tmp_path / name)
+        assert size == len(BODY)
+        assert elapsed >= 0
+        assert (tmp_path / name).read_bytes() == BODY
+
+    assert pool.idle[server].qsize() == 1
+    pool.close()
+
+
+def test_download_errors(server, tmp_path):
+    """Test that HTTP errors and truncated bodies are reported"""
+    pool = ConnectionPool()
+
+    with pytest.raises(Exception, match="HTTP 404"):
+        pool.download(server, "/missing", tmp_path / "missing")
+    with pytest.raises(Exception):
+        pool.download(server, "/truncated", tmp_path / "truncated")
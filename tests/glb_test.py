@@ -0,0 +1,102 @@
+import json
+import struct
+
+import numpy as np
+
+from src.glb import CHUNK_BIN, CHUNK_JSON, GLB_MAGIC, obj_to_glb
+
+OBJ = """mtllib duck.mtl
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vt 1 1
+vt 0 1
+vn 0 0 1
+usemtl duck
+f 1/1/1 2/2/1 3/3/1 4/4/1
+"""
+
+MTL = """newmtl duck
+Ns 250
+Kd 0.8 0.8 0.8
+map_Kd albedo.png
+"""
+
+
+def read_glb(data):
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    assert (magic, version, length) == (GLB_MAGIC, 2, len(data))
+
+    json_length, json_type = struct.unpack_from("<II", data, 12)
+    assert json_type == CHUNK_JSON
+    gltf = json.loads(data[20 : 20 + json_length])
+
+    offset = 20 + json_length
+    bin_length, bin_type = struct.unpack_from("<II", data, offset)
+    assert bin_type == CHUNK_BIN
+    return gltf, data[offset + 8 : offset + 8 + bin_length]
+
+
+def accessor_array(gltf, binary, index, dtype, width):
+    accessor = gltf["accessors"][index]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    data = binary[view["byteOffset"] : view["byteOffset"] + view["byteLength"]]
+    return np.frombuffer(data, dtype=dtype).reshape(accessor["count"], width)
+
+
+def test_obj_to_glb(tmp_path):
+    """Test converting a textured quad to a scaled, textured GLB"""
+    (tmp_path / "duck.obj").write_text(OBJ)
+    (tmp_path / "duck.mtl").write_text(MTL)
+    (tmp_path / "albedo.png").write_bytes(b"\x89PNG fake image")
+
+    gltf, binary = read_glb(obj_to_glb(str(tmp_path / "duck.obj"), scale=18))
+
+    primitive = gltf["meshes"][0]["primitives"][0]
+    positions = accessor_array(
+        gltf, binary, primitive["attributes"]["POSITION"], np.float32, 3
+    )
+    uvs = accessor_array(
+        gltf, binary, primitive["attributes"]["TEXCOORD_0"], np.float32, 2
+    )
+    indices = accessor_array(gltf, binary, primitive["indices"], np.uint16, 1)
+
+    assert len(positions) == 4
+    assert len(indices) == 6
+    assert positions.max() == 18
+    assert gltf["accessors"][primitive["attributes"]["POSITION"]]["max"] == [
+        18,
+        18,
+        0,
+    ]
+    # V is flipped for glTF
+    assert sorted(uvs[:, 1].tolist()) == [0, 0, 1, 1]
+    corner = positions.tolist().index([0, 0, 0])
+    assert uvs[corner].tolist() == [0, 1]
+
+    material = gltf["materials"][primitive["material"]]
+    texture = material["pbrMetallicRoughness"]["baseColorTexture"]["index"]
+    image = gltf["images"][gltf["textures"][texture]["source"]]
+    view = gltf["bufferViews"][image["bufferView"]]
+    assert image["mimeType"] == "image/png"
+    assert (
+        binary[view["byteOffset"] : view["byteOffset"] + view["byteLength"]]
+        == b"\x89PNG fake image"
+    )
+
+
+def test_obj_to_glb_computes_missing_normals(tmp_path):
+    """Test that normals are generated when the OBJ has none"""
+    (tmp_path / "tri.obj").write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n")
+
+    gltf, binary = read_glb(obj_to_glb(str(tmp_path / "tri.obj"), scale=1))
+
+    primitive = gltf["meshes"][0]["primitives"][0]
+    normals = accessor_array(
+        gltf, binary, primitive["attributes"]["NORMAL"], np.float32, 3
+    )
+    assert np.allclose(normals, [[0, 0, 1]] * 3)
+    assert "material" not in primitive
@@ -0,0 +1,33 @@
+import os
+
+from src.jobs import JobManager
+
+
+def test_failed_job_records_error():
+    """Test that exceptions raised by the job target mark the job as failed"""
+    manager = JobManager(max_workers=1)
+
+    def target(job):
+        raise Exception("boom")
+
+    job = manager.submit("prompt", target)
+    manager.executor.shutdown(wait=True)
+
+    assert job.status == "failed"
+    assert job.error == "boom"
+    assert job.result_path is None
+
+
+def test_prune_expired_jobs():
+    """Test that finished jobs are dropped once their TTL has passed"""
+    manager = JobManager(max_workers=1, job_ttl=0)
+
+    job = manager.submit("prompt", lambda job: b"glb")
+    manager.executor.shutdown(wait=True)
+    assert os.path.exists(job.result_path)
+
+    job.finished_at -= 1
+    manager.prune()
+
+    assert manager.get(job.id) is None
+    assert not os.path.exists(job.result_path)
@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from src.llm import (
+    ContextCache,
+    OllamaClient,
+    TokenCoalescer,
+    parse_line,
+    replay,
+)
+
+aborted = threading.Event()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        payload = json.loads(
+            self.rfile.read(int(self.headers["Content-Length"]))
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        tokens = 3 if payload["prompt"] == "short" else 1000
+        try:
+            for i in range(tokens):
+                self.write_chunk({"response": f"token{i} ", "done": False})
+                if tokens > 3:
+                    time.sleep(0.01)
+            self.write_chunk({"response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            aborted.set()
+            self.close_connection = True
+
+    def write_chunk(self, chunk):
+        line = json.dumps(chunk).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_stream_reuses_connection(server):
+    """Test that chunks are streamed and the connection is kept alive"""
+    client = OllamaClient(server, max_concurrent=1, queue_timeout=0)
+
+    for _ in range(2):
+        stream = client.generate({"model": "mistral", "prompt": "short"})
+        chunks = [json.loads(line) for line in stream]
+        assert [chunk["response"] for chunk in chunks[:-1]] == [
+            "token0 ",
+            "token1 ",
+            "token2 ",
+        ]
+        assert chunks[-1]["done"]
+
+    assert client.pool.idle[server].qsize() == 1
+    client.close()
+
+
+def test_close_aborts_generation(server):
+    """Test that closing a stream drops the upstream request and its slot"""
+    aborted.clear()
+    client = OllamaClient(server, max_concurrent=1, queue_timeout=0)
+
+    stream = client.generate({"model": "mistral", "prompt": "long"})
+    next(stream)
+    assert client.generate({"model": "mistral", "prompt": "short"}) is None
+
+    stream.close()
+    assert aborted.wait(5)
+    assert server not in client.pool.idle or client.pool.idle[server].empty()
+
+    # The slot is free again, also for streams closed before they start
+    client.generate({"model": "mistral", "prompt": "short"}).close()
+    assert list(client.generate({"model": "mistral", "prompt": "short"}))
+
+
+def test_parse_line_fast_path():
+    """Test that token lines are not decoded and others are"""
+    line = b'{"model":"mistral","response":"a \\"b\\"\\n","done":false}\n'
+    assert parse_line(line) == (b'a \\"b\\"\\n', None)
+
+    fragment, chunk = parse_line(b'{"response":"","done":true,"context":[1]}')
+    assert fragment is None and chunk["context"] == [1]
+
+    with pytest.raises(Exception, match="model not found"):
+        parse_line(b'{"error":"model not found"}')
+
+
+def test_coalescer_batches_tokens():
+    """Test that tokens are merged into valid SSE frames"""
+    lines = [
+        json.dumps({"response": token, "done": False}).encode("utf-8")
+        for token in ("Once", " upon", ' a "time"', " \u00e9")
+    ]
+    lines.append(b'{"response":"!","done":true,"context":[7]}')
+
+    coalescer = TokenCoalescer(window=60)
+    frames = list(coalescer.frames(lines))
+    assert len(frames) == 1
+    text = json.loads(frames[0][len(b"data: ") :])["text"]
+    assert text == 'Once upon a "time" \u00e9!'
+    assert coalescer.final["context"] == [7]
+
+    frames = list(TokenCoalescer(window=0).frames(lines))
+    assert len(frames) == 5
+
+    frames = list(TokenCoalescer(window=60, max_bytes=8).frames(lines))
+    assert len(frames) == 3
+
+
+def test_replay_paces_frames():
+    """Test that recorded frames keep their relative timing"""
+    frames = [(0.0, b"a"), (0.2, b"b"), (0.4, b"c")]
+
+    started = time.monotonic()
+    assert list(replay(frames, speed=2)) == [b"a", b"b", b"c"]
+    assert 0.2 <= time.monotonic() - started < 0.4
+
+    with patch("src.llm.time.sleep") as sleep:
+        assert list(replay(frames, speed=0)) == [b"a", b"b", b"c"]
+    sleep.assert_not_called()
+
+
+def wait_for_refresh(cache):
+    """Wait until no entry of `cache` is being refreshed"""
+    deadline = time.monotonic() + 5
+    while any(entry["busy"] for entry in cache.entries.values()):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_context_cache_primes_once_per_model_digest():
+    """Test that the system prompt is primed again only on model change"""
+    client = OllamaClient("localhost:11434")
+    digests = ["sha256:a", "sha256:a", "sha256:b"]
+
+    def request(method, path, payload=None):
+        if path == "/api/tags":
+            return {
+                "models": [{"name": "mistral:latest", "digest": digests.pop(0)}]
+            }
+        assert payload["system"] == "Be brief."
+        assert payload["options"] == {"num_predict": 1}
+        return {"context": [len(digests)]}
+
+    with patch.object(client, "request", side_effect=request) as mock_request:
+        cache = ContextCache(client, check_interval=0)
+        contexts = []
+        for _ in range(4):
+            contexts.append(cache.get("mistral", "Be brief."))
+            wait_for_refresh(cache)
+
+    # Each request gets the context primed before it arrived
+    assert contexts == [None, [2], [2], [0]]
+    generate_calls = [
+        call
+        for call in mock_request.call_args_list
+        if call.args[1] != "/api/tags"
+    ]
+    assert len(generate_calls) == 2
+
+
+def test_context_cache_primes_in_background():
+    """Test that requests never wait for priming"""
+    client = OllamaClient("localhost:11434")
+    priming = threading.Event()
+    release = threading.Event()
+
+    def request(method, path, payload=None):
+        if path == "/api/tags":
+            return {"models": [{"name": "mistral", "digest": "sha256:a"}]}
+        priming.set()
+        release.wait(5)
+        return {"context": [len(payload["system"])]}
+
+    with patch.object(client, "request", side_effect=request):
+        cache = ContextCache(client)
+        # The triggering request and those arriving meanwhile fall back
+        assert cache.get("mistral", "slow") is None
+        assert priming.wait(5)
+        assert cache.get("mistral", "slow") is None
+        release.set()
+        wait_for_refresh(cache)
+        assert cache.get("mistral", "slow") == [4]
+
+
+def test_context_cache_backs_off_after_failure():
+    """Test that a failed priming is not retried on every request"""
+    client = OllamaClient("localhost:11434", max_concurrent=1, queue_timeout=0)
+
+    with (
+        patch.object(
+            client, "model_digest", return_value="sha256:a"
+        ) as mock_digest,
+        patch.object(client, "request") as mock_request,
+    ):
+        cache = ContextCache(client, retry_delay=60)
+        # Priming needs a generation slot like any other request
+        with client.slot():
+            assert cache.get("mistral", "Be brief.") is None
+            wait_for_refresh(cache)
+        assert cache.get("mistral", "Be brief.") is None
+
+    mock_request.assert_not_called()
+    assert mock_digest.call_count == 1
@@ -0,0 +1,37 @@
+import pytest
+
+from src.metrics import Registry, StageMetrics
+
+
+def test_histogram_rendering():
+    """Test that histograms render cumulative buckets, sum and count"""
+    registry = Registry()
+    histogram = registry.histogram(
+        "duration_seconds", "Duration", ["stage"], buckets=(1, 5)
+    )
+
+    histogram.observe(0.5, stage="download")
+    histogram.observe(3, stage="download")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE duration_seconds histogram" in lines
+    assert 'duration_seconds_bucket{stage="download",le="1"} 1' in lines
+    assert 'duration_seconds_bucket{stage="download",le="5"} 2' in lines
+    assert 'duration_seconds_bucket{stage="download",le="+Inf"} 2' in lines
+    assert 'duration_seconds_sum{stage="download"} 3.5' in lines
+    assert 'duration_seconds_count{stage="download"} 2' in lines
+
+
+def test_span_counts_errors():
+    """Test that a failing span is timed and counted as an error"""
+    registry = Registry()
+    stages = StageMetrics(registry)
+
+    with pytest.raises(ValueError):
+        with stages.span("conversion"):
+            raise ValueError("broken mesh")
+
+    output = registry.render()
+    assert 'tcp_stage_errors_total{stage="conversion"} 1' in output
+    assert 'tcp_stage_in_flight{stage="conversion"} 0' in output
+    assert 'tcp_stage_duration_seconds_count{stage="conversion"} 1' in output
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from src.profiling import NodeProfiler, percentile
+
+
+def test_percentile_nearest_rank():
+    """Test nearest-rank percentiles"""
+    samples = list(range(1, 101))
+    assert percentile(samples, 0.5) == 50
+    assert percentile(samples, 0.95) == 95
+    assert percentile([3.0], 0.95) == 3.0
+
+
+def test_timer_records_node_durations(tmp_path):
+    """Test that executing events are turned into persisted durations"""
+    workflow = {
+        "3": {"class_type": "KSampler"},
+        "8": {"class_type": "VAEDecode"},
+    }
+    path = tmp_path / "profile.json"
+    profiler = NodeProfiler(workflow, str(path), name="paint3d")
+    timer = profiler.timer()
+
+    events = [
+        (0.0, {"type": "executing", "data": {"node": "3"}}),
+        (2.0, {"type": "executing", "data": {"node": "8"}}),
+        # Replayed late, but timed by when it was received
+        (
+            9.0,
+            {"type": "executing", "data": {"node": None}, "received_at": 2.5},
+        ),
+        (9.1, {"type": "execution_success", "data": {}}),
+    ]
+    for now, message in events:
+        with patch("src.profiling.time.monotonic", return_value=now):
+            timer.handle(message)
+
+    stats = {entry["node"]: entry for entry in profiler.stats()}
+    assert stats["3"]["class_type"] == "KSampler"
+    assert stats["3"]["p50"] == 2.0
+    assert stats["8"]["p95"] == 0.5
+    assert profiler.folded().splitlines()[0] == "paint3d;KSampler;node 3 2000"
+
+    # The profile is reloaded from disk once saved
+    assert not path.exists()
+    profiler.save()
+    reloaded = NodeProfiler(workflow, str(path))
+    assert reloaded.class_type_stats()[0]["class_type"] == "KSampler"
@@ -0,0 +1,39 @@
+import time
+
+from src.sessions import Session, SessionStore
+
+
+def test_evicted_sessions_spill_to_disk(tmp_path):
+    """Test that sessions beyond the memory limit are reloaded from disk"""
+    store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+    first = store.create("mistral")
+    first.add_turn("Aria", "Aria wakes.", [1, 2, 3])
+    store.save(first)
+    store.create("mistral")
+
+    assert first.id not in store.sessions
+    reloaded = store.get(first.id)
+    assert reloaded.context == [1, 2, 3]
+    assert reloaded.turns == [{"user": "Aria", "assistant": "Aria wakes."}]
+
+
+def test_expired_sessions_are_forgotten():
+    """Test that sessions older than the TTL are not returned"""
+    store = SessionStore(ttl=60)
+    session = store.create("mistral")
+    assert store.get(session.id) is session
+
+    session.updated_at = time.time() - 120
+    assert store.get(session.id) is None
+    assert store.get("../../etc/passwd") is None
+
+
+def test_transcript_keeps_latest_turns():
+    """Test that history is truncated to the token budget, oldest first"""
+    session = Session("mistral")
+    for i in range(10):
+        session.add_turn(f"turn {i}", "x" * 400, None)
+
+    transcript = session.transcript(max_tokens=250)
+    assert "turn 9" in transcript and "turn 8" in transcript
+    assert "turn 7" not in transcript
@@ -0,0 +1,68 @@
+import json
+
+from src.workflow import WorkflowTemplate, prompt_request_body, prune_workflow
+
+WORKFLOW = {
+    "4": {"class_type": "CLIPTextEncode", "inputs": {"text": "old"}},
+    "9": {
+        "class_type": "3D_TrainConfig",
+        "inputs": {"seed": 1, "mesh_file_path": "/mesh.obj", "steps": 30},
+    },
+}
+FIELDS = {
+    "text": ("4", "text"),
+    "seed": ("9", "seed"),
+    "mesh_file_path": ("9", "mesh_file_path"),
+}
+
+
+def test_render_injects_fields():
+    """Test that rendered prompts contain the injected values"""
+    template = WorkflowTemplate(WORKFLOW, FIELDS)
+
+    prompt = json.loads(template.render(text='a "quoted" duck', seed="42"))
+
+    assert prompt["4"]["inputs"]["text"] == 'a "quoted" duck'
+    assert prompt["9"]["inputs"]["seed"] == "42"
+    # Fields not given keep the workflow value
+    assert prompt["9"]["inputs"]["mesh_file_path"] == "/mesh.obj"
+    assert prompt["9"]["inputs"]["steps"] == 30
+
+
+def test_render_does_not_touch_workflow():
+    """Test that rendering leaves the source workflow unchanged"""
+    template = WorkflowTemplate(WORKFLOW, FIELDS)
+    template.render(text="new", seed=2)
+
+    assert WORKFLOW["4"]["inputs"]["text"] == "old"
+    assert WORKFLOW["9"]["inputs"]["seed"] == 1
+
+
+def test_prompt_request_body():
+    """Test wrapping a serialized prompt into a /prompt request body"""
+    body = prompt_request_body(b'{"1": {}}', client_id="c", prompt_id="p")
+
+    assert json.loads(body) == {
+        "prompt": {"1": {}},
+        "client_id": "c",
+        "prompt_id": "p",
+    }
+    assert json.loads(prompt_request_body({"1": {}})) == {"prompt": {"1": {}}}
+
+
+def test_prune_keeps_only_consumed_outputs():
+    """Test that previews and nodes only they depend on are removed"""
+    workflow = {
+        "1": {"class_type": "Loader", "inputs": {}},
+        "2": {"class_type": "Sampler", "inputs": {"model": ["1", 0]}},
+        "3": {"class_type": "Save", "inputs": {"image": ["2", 0]}},
+        "4": {"class_type": "PreviewImage", "inputs": {"images": ["2", 0]}},
+        "5": {"class_type": "Render", "inputs": {"mesh": ["3", 0]}},
+        "6": {"class_type": "PreviewImage", "inputs": {"images": ["5", 0]}},
+    }
+
+    pruned = prune_workflow(workflow, ["Save"])
+
+    assert sorted(pruned) == ["1", "2", "3"]
+    assert sorted(prune_workflow(workflow, ["5"])) == ["1", "2", "3", "5"]
+    assert len(workflow) == 6
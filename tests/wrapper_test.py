@@ -1,9 +1,16 @@
+import io
 import json
-from unittest.mock import Mock, patch
+import os
+import tarfile
+import time
+from urllib.error import HTTPError, URLError
+from unittest.mock import MagicMock, Mock, patch
 
 import pytest
 from flask import Flask
+from werkzeug.test import EnvironBuilder
 
+from src.app import create_app
 from src.wrapper import Wrapper
 
 
@@ -43,34 +50,70 @@ def test_texture_endpoint_workflow_error():
         assert json.loads(response.data)["error"] == "Workflow file not loaded"
 
 
-@patch("websocket.WebSocket")
-def test_process_prompt_execution_error(mock_ws):
+def test_process_prompt_execution_error():
     """Test handling of execution errors in process_prompt"""
     wrapper = Wrapper()
     context = {
         "temp_dir": "mock_dir"
     }  # Mock context instead of creating real directory
+    backend = wrapper.backends.backends[0]
 
-    ws_instance = Mock()
-    mock_ws.return_value = ws_instance
+    def queue_prompt(prompt, context):
+        # The error may arrive before the queue response comes back
+        backend.monitor.dispatch(
+            {
+                "type": "execution_error",
+                "data": {"prompt_id": "test-id", "error": "Test error message"},
+            }
+        )
+        return {"prompt_id": "test-id"}
 
-    ws_instance.recv.return_value = json.dumps(
-        {
-            "type": "execution_error",
-            "data": {"prompt_id": "test-id", "error": "Test error message"},
-        }
-    )
+    with (
+        patch.object(wrapper.backends, "start"),
+        patch.object(
+            backend.monitor, "start", side_effect=backend.monitor.connected.set
+        ),
+        patch.object(wrapper, "queue_prompt", side_effect=queue_prompt),
+    ):
+        success = wrapper.process_prompt({"test": "prompt"}, context)
 
-    success = wrapper.process_prompt({"test": "prompt"}, context)
     assert not success
+    assert backend.in_flight == 0
+
+
+def test_rejected_prompt_keeps_backend_healthy():
+    """Test that only connection errors and 5xx count as backend failures"""
+    wrapper = Wrapper()
+    backend = wrapper.backends.backends[0]
+    errors = [
+        HTTPError("url", 400, "Bad Request", {}, None),
+        HTTPError("url", 503, "Service Unavailable", {}, None),
+        URLError("Connection refused"),
+    ]
+
+    with (
+        patch.object(wrapper.backends, "start"),
+        patch.object(
+            backend.monitor, "start", side_effect=backend.monitor.connected.set
+        ),
+        patch.object(wrapper, "queue_prompt", side_effect=errors),
+    ):
+        failures = []
+        for _ in errors:
+            with pytest.raises(OSError):
+                wrapper.submit_prompt({}, {})
+            failures.append(backend.failures)
 
+    assert failures == [0, 1, 2]
+    assert backend.in_flight == 0
 
-@patch("urllib.request.urlopen")
-def test_download_files_error(mock_urlopen):
+
+@patch("src.downloads.ConnectionPool.download")
+def test_download_files_error(mock_download):
     """Test handling of file download errors"""
     wrapper = Wrapper()
     context = {"temp_dir": "mock_dir"}  # Mock context
-    mock_urlopen.side_effect = Exception("Download failed")
+    mock_download.side_effect = Exception("Download failed")
 
     file_paths = wrapper.download_files(context)
     assert all(path is None for path in file_paths.values())
@@ -97,3 +140,748 @@ def test_cleanup(mock_rmtree, mock_exists):
     wrapper.cleanup_context(context)
 
     mock_rmtree.assert_called_once_with("mock_dir")
+
+
+def test_texture_job_lifecycle():
+    """Test submitting a texture job and fetching its result"""
+    wrapper = Wrapper()
+
+    with (
+        patch.object(wrapper, "process_prompt", return_value=True),
+        patch.object(
+            wrapper, "process_and_convert_to_glb", return_value=b"glTF-data"
+        ),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture/jobs", json={"user_prompt": "test prompt"}
+            )
+            assert response.status_code == 202
+            job_id = json.loads(response.data)["job_id"]
+
+            wrapper.jobs.executor.shutdown(wait=True)
+
+            response = client.get(f"/api/texture/jobs/{job_id}")
+            assert json.loads(response.data)["status"] == "completed"
+
+            response = client.get(f"/api/texture/jobs/{job_id}/result")
+            assert response.status_code == 200
+            assert response.mimetype == "model/gltf-binary"
+            assert response.data == b"glTF-data"
+
+
+def test_texture_job_cache_hit_is_not_timed(tmp_path):
+    """Test that cached jobs skip admission and the generation average"""
+    wrapper = Wrapper(deterministic=True, cache_dir=str(tmp_path))
+    seed = wrapper.prompt_seed("duck")
+    wrapper.result_cache.put(wrapper.result_cache_key("duck", seed), b"glTF")
+    average_duration = wrapper.admission.average_duration
+
+    with (
+        patch.object(wrapper, "process_prompt") as mock_process,
+        patch.object(wrapper.admission, "admit") as mock_admit,
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture/jobs", json={"user_prompt": "duck"}
+            )
+            job_id = json.loads(response.data)["job_id"]
+            wrapper.jobs.executor.shutdown(wait=True)
+
+            response = client.get(f"/api/texture/jobs/{job_id}/result")
+            assert response.data == b"glTF"
+
+    mock_process.assert_not_called()
+    mock_admit.assert_not_called()
+    assert wrapper.admission.average_duration == average_duration
+
+
+def test_texture_job_not_found(client):
+    """Test polling an unknown texture job"""
+    response = client.get("/api/texture/jobs/unknown")
+    assert response.status_code == 404
+    assert json.loads(response.data)["error"] == "Job not found"
+
+
+def test_process_prompt_uses_shared_monitor():
+    """Test that process_prompt waits on the backend's shared monitor"""
+    wrapper = Wrapper()
+    monitor = wrapper.backends.backends[0].monitor
+    progress = Mock()
+
+    def queue_prompt(prompt, context):
+        assert context["client_id"] == monitor.client_id
+        # The monitor listens before the prompt is queued
+        assert monitor.connected.is_set()
+        monitor.dispatch(
+            {"type": "executing", "data": {"prompt_id": "id", "node": "26"}}
+        )
+        monitor.dispatch(
+            {"type": "execution_success", "data": {"prompt_id": "id"}}
+        )
+        return {"prompt_id": "id"}
+
+    with (
+        patch.object(wrapper, "queue_prompt", side_effect=queue_prompt),
+        patch.object(wrapper.backends, "start"),
+        patch.object(
+            monitor, "start", side_effect=monitor.connected.set
+        ) as mock_start,
+    ):
+        context = {"temp_dir": "mock_dir"}
+        assert wrapper.process_prompt({}, context, progress)
+
+    mock_start.assert_called_once()
+    progress.assert_called_with("executing", "26")
+    assert context["server_address"] == wrapper.server_address
+    assert wrapper.backends.backends[0].in_flight == 0
+
+
+def test_build_prompt_uses_job_scoped_mesh():
+    """Test that each job gets its own mesh path keyed by prompt id"""
+    wrapper = Wrapper()
+    template_mesh = wrapper.workflow["9"]["inputs"]["mesh_file_path"]
+
+    prompt = json.loads(wrapper.build_prompt("duck", {"prompt_id": "abc"}))
+
+    mesh_path = prompt["9"]["inputs"]["mesh_file_path"]
+    assert mesh_path.endswith("/jobs/abc/final_rubber_duck.obj")
+    assert wrapper.workflow["9"]["inputs"]["mesh_file_path"] == template_mesh
+
+
+@patch("src.downloads.ConnectionPool.download")
+def test_download_files_job_scoped_url(mock_download):
+    """Test that downloads use the job-scoped route when a prompt id is set"""
+    wrapper = Wrapper(bundle_downloads=False)
+    context = {"temp_dir": "mock_dir", "prompt_id": "abc"}
+    mock_download.return_value = (42, 0.1)
+
+    file_paths = wrapper.download_files(context)
+
+    paths = [call.args[1] for call in mock_download.call_args_list]
+    assert "/download/abc/albedo.png" in paths
+    assert file_paths["texture"] == os.path.join("mock_dir", "albedo.png")
+    assert context["download_timings"]["albedo.png"] == 0.1
+
+
+def test_conversion_falls_back_to_blender():
+    """Test that a failing in-process conversion falls back to Blender"""
+    wrapper = Wrapper()
+    context = {"temp_dir": "mock_dir"}
+
+    with (
+        patch.object(
+            wrapper, "download_files", return_value={"obj": "missing.obj"}
+        ),
+        patch.object(
+            wrapper, "convert_with_blender", return_value=b"glTF"
+        ) as mock_blender,
+    ):
+        assert wrapper.process_and_convert_to_glb(context) == b"glTF"
+
+    mock_blender.assert_called_once_with("missing.obj", context)
+
+
+@patch("subprocess.run")
+def test_blender_pool_falls_back_to_script(mock_run):
+    """Test that a failing Blender pool falls back to the one-shot script"""
+    wrapper = Wrapper(converter="blender")
+    wrapper.blender_pool = Mock(healthy=True)
+    wrapper.blender_pool.convert.side_effect = Exception("pool down")
+    mock_run.return_value = Mock(returncode=1, stderr="no blender")
+
+    with pytest.raises(Exception, match="no blender"):
+        wrapper.convert_with_blender("duck.obj", {"temp_dir": "mock_dir"})
+
+    wrapper.blender_pool.convert.assert_called_once()
+    mock_run.assert_called_once()
+
+
+def test_deterministic_seed():
+    """Test that deterministic mode derives the seed from the prompt"""
+    wrapper = Wrapper(deterministic=True)
+
+    assert wrapper.prompt_seed("duck") == wrapper.prompt_seed("duck")
+    assert wrapper.prompt_seed("duck") != wrapper.prompt_seed("goose")
+    assert 0 <= int(wrapper.prompt_seed("duck")) < 2**32
+
+
+def test_texture_endpoint_cache_hit(tmp_path):
+    """Test that a repeated prompt is served from the result cache"""
+    wrapper = Wrapper(deterministic=True, cache_dir=str(tmp_path))
+    seed = wrapper.prompt_seed("duck")
+    wrapper.result_cache.put(wrapper.result_cache_key("duck", seed), b"glTF")
+
+    with patch.object(wrapper, "process_prompt") as mock_process:
+        with wrapper.app.test_client() as client:
+            response = client.post("/api/texture", json={"user_prompt": "duck"})
+
+    mock_process.assert_not_called()
+    assert response.status_code == 200
+    assert json.loads(response.data)["glb_data"] == "Z2xURg=="
+
+
+def test_texture_endpoint_binary_response(tmp_path):
+    """Test that Accept: model/gltf-binary returns the raw GLB"""
+    wrapper = Wrapper(deterministic=True, cache_dir=str(tmp_path))
+    cache_key = wrapper.result_cache_key("duck", wrapper.prompt_seed("duck"))
+    wrapper.result_cache.put(cache_key, b"glTF")
+    headers = {"Accept": "model/gltf-binary"}
+
+    with wrapper.app.test_client() as client:
+        response = client.post(
+            "/api/texture", json={"user_prompt": "duck"}, headers=headers
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "model/gltf-binary"
+        assert response.headers["Content-Length"] == "4"
+        assert response.headers["ETag"] == f'"{cache_key}"'
+        assert response.data == b"glTF"
+
+
+def test_texture_endpoint_stores_fresh_result(tmp_path, capsys):
+    """Test that a generated GLB is cached without logging a cache hit"""
+    wrapper = Wrapper(deterministic=True, cache_dir=str(tmp_path))
+    cache_key = wrapper.result_cache_key("duck", wrapper.prompt_seed("duck"))
+    headers = {"Accept": "model/gltf-binary"}
+
+    with (
+        patch.object(wrapper, "process_prompt", return_value=True),
+        patch.object(
+            wrapper, "process_and_convert_to_glb", return_value=b"GLB"
+        ),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture", json={"user_prompt": "duck"}, headers=headers
+            )
+            assert response.data == b"GLB"
+
+    assert wrapper.result_cache.get(cache_key) == b"GLB"
+    assert "Result cache hit" not in capsys.readouterr().out
+
+
+def test_texture_endpoint_binary_response_without_cache():
+    """Test the binary response for a freshly generated, uncached GLB"""
+    wrapper = Wrapper()
+
+    with (
+        patch.object(wrapper, "process_prompt", return_value=True),
+        patch.object(
+            wrapper, "process_and_convert_to_glb", return_value=b"glTF"
+        ),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture",
+                json={"user_prompt": "duck"},
+                headers={"Accept": "model/gltf-binary"},
+            )
+
+    assert response.status_code == 200
+    assert response.data == b"glTF"
+    assert response.headers["Content-Length"] == "4"
+    assert "ETag" in response.headers
+
+
+def test_texture_endpoint_failure_cleans_up():
+    """Test that a failed generation cleans up and is not timed"""
+    wrapper = Wrapper()
+
+    with (
+        patch.object(wrapper, "process_prompt", return_value=False),
+        patch.object(wrapper, "cleanup_context") as mock_cleanup,
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post("/api/texture", json={"user_prompt": "duck"})
+
+    assert response.status_code == 500
+    assert json.loads(response.data)["error"] == "Prompt execution failed"
+    mock_cleanup.assert_called_once()
+    assert "prompt_id" in mock_cleanup.call_args[0][0]
+    # Instant failures must not pull the duration estimate down
+    assert wrapper.admission.average_duration == 120.0
+    assert wrapper.admission.stats()["in_flight"] == 0
+
+
+def test_create_app():
+    """Test the WSGI application factory"""
+    app = create_app(max_texture_jobs=1)
+
+    assert isinstance(app, Flask)
+    assert isinstance(app.extensions["tcp"], Wrapper)
+
+
+def test_shutdown_drains_jobs():
+    """Test that shutdown waits for jobs and rejects new submissions"""
+    wrapper = Wrapper()
+    job = wrapper.jobs.submit("duck", lambda job: b"glTF")
+
+    wrapper.shutdown()
+
+    assert job.status == "completed"
+    with wrapper.app.test_client() as client:
+        response = client.post(
+            "/api/texture/jobs", json={"user_prompt": "duck"}
+        )
+    assert response.status_code == 503
+
+
+def test_texture_endpoint_queue_full():
+    """Test that requests beyond the queue limit get 429 with Retry-After"""
+    wrapper = Wrapper(max_in_flight=1, max_queued=0)
+    wrapper.admission.admit()
+
+    with wrapper.app.test_client() as client:
+        response = client.post("/api/texture", json={"user_prompt": "duck"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+        response = client.post(
+            "/api/texture/jobs", json={"user_prompt": "duck"}
+        )
+        assert response.status_code == 429
+
+        response = client.get("/api/queue")
+        assert json.loads(response.data)["in_flight"] == 0
+        assert json.loads(response.data)["queued"] == 1
+
+
+def test_texture_job_priority():
+    """Test that the priority lane sets the ComfyUI queue number"""
+    wrapper = Wrapper()
+    numbers = []
+
+    def process_prompt(prompt, context, progress=None):
+        numbers.append(context["queue_number"])
+        return True
+
+    with (
+        patch.object(wrapper, "process_prompt", side_effect=process_prompt),
+        patch.object(wrapper, "process_and_convert_to_glb", return_value=b""),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture/jobs",
+                json={"user_prompt": "duck", "priority": "urgent"},
+            )
+            assert response.status_code == 400
+
+            for priority in ("batch", "interactive"):
+                client.post(
+                    "/api/texture/jobs",
+                    json={"user_prompt": "duck", "priority": priority},
+                )
+            wrapper.jobs.executor.shutdown(wait=True)
+
+    batch_number, interactive_number = sorted(numbers, reverse=True)
+    assert batch_number - interactive_number > 500
+
+
+def test_texture_batch_streams_results():
+    """Test that batch prompts run on admission slots and stream results"""
+    wrapper = Wrapper(max_in_flight=2)
+    submitted = []
+    in_flight = []
+
+    def submit_prompt(prompt, context, on_message=None):
+        submitted.append(context["queue_number"])
+        return Mock(), Mock()
+
+    def wait_for_prompt(backend, watch):
+        in_flight.append(wrapper.admission.stats()["in_flight"])
+        return True
+
+    with (
+        patch.object(wrapper, "submit_prompt", side_effect=submit_prompt),
+        patch.object(wrapper, "wait_for_prompt", side_effect=wait_for_prompt),
+        patch.object(
+            wrapper, "process_and_convert_to_glb", return_value=b"glTF-data"
+        ),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture/batch",
+                json={"prompts": ["duck", "pirate duck", "robot duck"]},
+            )
+            assert response.mimetype == "application/x-ndjson"
+            lines = [json.loads(line) for line in response.data.splitlines()]
+
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert all(line["status"] == "success" for line in lines)
+    assert lines[0]["glb_data"] == "Z2xURi1kYXRh"
+    assert len(set(submitted)) == 3
+    assert max(in_flight) <= 2
+    assert wrapper.admission.stats()["in_flight"] == 0
+    assert wrapper.admission.stats()["queued"] == 0
+
+
+def test_texture_batch_validation(client):
+    """Test batch requests with missing or mismatched parameters"""
+    response = client.post("/api/texture/batch", json={})
+    assert response.status_code == 400
+
+    response = client.post(
+        "/api/texture/batch", json={"prompts": ["duck"], "seeds": [1, 2]}
+    )
+    assert response.status_code == 400
+
+    # Larger than the admission queue could ever hold
+    response = client.post(
+        "/api/texture/batch", json={"prompts": ["duck"] * 21}
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data)["error"] == "At most 20 prompts per batch"
+
+
+def test_texture_batch_queue_full():
+    """Test that a batch which does not fit the queue is refused whole"""
+    wrapper = Wrapper(max_in_flight=1, max_queued=4)
+    wrapper.admission.admit()
+
+    with patch.object(wrapper, "submit_prompt") as mock_submit:
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture/batch", json={"prompts": ["duck"] * 5}
+            )
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) >= 1
+
+            response = client.get("/api/queue")
+            assert json.loads(response.data)["queued"] == 1
+
+        # Admitted, but closed before anything was streamed
+        environ = EnvironBuilder(
+            path="/api/texture/batch",
+            method="POST",
+            json={"prompts": ["duck"] * 4},
+        ).get_environ()
+        wrapper.app(environ, lambda status, headers: None).close()
+
+    mock_submit.assert_not_called()
+    assert wrapper.admission.stats()["queued"] == 1
+
+
+def test_texture_job_events():
+    """Test that job progress is streamed as server-sent events"""
+    wrapper = Wrapper()
+
+    def process_prompt(prompt, context, progress=None):
+        progress("executing", "3", [10, 20])
+        return True
+
+    with (
+        patch.object(wrapper, "process_prompt", side_effect=process_prompt),
+        patch.object(wrapper, "process_and_convert_to_glb", return_value=b""),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.get("/api/texture/jobs/unknown/events")
+            assert response.status_code == 404
+
+            response = client.post(
+                "/api/texture/jobs", json={"user_prompt": "duck"}
+            )
+            job_id = json.loads(response.data)["job_id"]
+            response = client.get(f"/api/texture/jobs/{job_id}/events")
+            assert response.mimetype == "text/event-stream"
+            events = [
+                json.loads(line[len("data: ") :])
+                for line in response.get_data(as_text=True).splitlines()
+                if line.startswith("data: ")
+            ]
+
+    assert events[-1] == {
+        "type": "completed",
+        "result_url": f"/api/texture/jobs/{job_id}/result",
+    }
+
+
+def test_texture_job_queued_until_admitted():
+    """Test that a job waiting for a slot reports its queue position"""
+    wrapper = Wrapper(max_in_flight=1)
+    held = wrapper.admission.admit()
+    held.__enter__()
+
+    with (
+        patch.object(wrapper, "process_prompt", return_value=True),
+        patch.object(wrapper, "process_and_convert_to_glb", return_value=b""),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/texture/jobs", json={"user_prompt": "duck"}
+            )
+            job = wrapper.jobs.get(json.loads(response.data)["job_id"])
+            # Wait for the job to block on its ticket
+            while job.ticket not in wrapper.admission.waiters:
+                time.sleep(0.01)
+
+            state = job.to_dict()
+            assert state["status"] == "queued"
+            assert state["started_at"] is None
+            events = wrapper.job_events(job, state, "")
+            assert events[0] == {"type": "queue", "position": 0}
+
+            held.__exit__(None, None, None)
+            wrapper.jobs.executor.shutdown(wait=True)
+
+    assert job.status == "completed"
+    assert job.started_at is not None
+
+
+def test_prompt_message_handler_reports_steps():
+    """Test that sampler progress messages are reported as steps"""
+    wrapper = Wrapper()
+    progress = Mock()
+    handle_message = wrapper.prompt_message_handler(progress)
+
+    handle_message(
+        {"type": "progress", "data": {"node": "3", "value": 5, "max": 20}}
+    )
+
+    progress.assert_called_once_with("executing", "3", [5, 20])
+
+
+def test_metrics_endpoint():
+    """Test that stage timings are exported in the Prometheus format"""
+    wrapper = Wrapper()
+
+    with (
+        patch.object(wrapper, "process_prompt", return_value=True),
+        patch.object(wrapper, "download_files", return_value={"obj": "x"}),
+        patch("src.wrapper.obj_to_glb", return_value=b"glTF"),
+        patch.object(wrapper, "cleanup_context"),
+    ):
+        with wrapper.app.test_client() as client:
+            client.post("/api/texture", json={"user_prompt": "duck"})
+            response = client.get("/metrics")
+
+    assert response.mimetype == "text/plain"
+    output = response.get_data(as_text=True)
+    for stage in ("queue_wait", "conversion", "encode"):
+        assert (
+            f'tcp_stage_duration_seconds_count{{stage="{stage}"}} 1' in output
+        )
+    assert "tcp_admission_in_flight 0" in output
+
+
+def test_profile_endpoint():
+    """Test that node timings are reported as JSON and folded stacks"""
+    wrapper = Wrapper()
+    wrapper.profiler.record("26", 1.5)
+
+    with wrapper.app.test_client() as client:
+        response = client.get("/api/profile")
+        nodes = json.loads(response.data)["nodes"]
+        assert nodes[0]["class_type"] == "KSampler"
+
+        response = client.get("/api/profile?format=folded")
+        assert response.get_data(as_text=True).endswith(
+            "KSampler;node 26 1500\n"
+        )
+
+
+def test_workflow_is_pruned():
+    """Test that preview nodes are stripped from the submitted workflow"""
+    wrapper = Wrapper()
+    prompt = json.loads(wrapper.build_prompt("duck"))
+
+    class_types = {node["class_type"] for node in prompt.values()}
+    assert "3D_SaveUVMapImage" in class_types
+    assert "PreviewImage" not in class_types
+    assert "3D_GeneratePreviewVideo" not in class_types
+
+    assert len(Wrapper(workflow_outputs=None).workflow) == 61
+
+
+def test_download_files_bundle(tmp_path):
+    """Test that job outputs are fetched as one tar bundle and unpacked"""
+    wrapper = Wrapper()
+    context = {"temp_dir": str(tmp_path), "prompt_id": "abc"}
+    paths = []
+
+    def download(host, path, save_path):
+        paths.append(path)
+        with tarfile.open(save_path, "w") as tar:
+            for name in ("final_rubber_duck.obj", "final_rubber_duck.mtl"):
+                info = tarfile.TarInfo(name)
+                info.size = 4
+                tar.addfile(info, io.BytesIO(b"data"))
+            info = tarfile.TarInfo("albedo.png")
+            info.size = 3
+            tar.addfile(info, io.BytesIO(b"png"))
+        return 1024, 0.2
+
+    with patch.object(wrapper.downloads, "download", side_effect=download):
+        file_paths = wrapper.download_files(context)
+
+    assert paths == [
+        "/download/abc/bundle?files="
+        "final_rubber_duck.obj,final_rubber_duck.mtl,albedo.png"
+    ]
+    with open(file_paths["texture"], "rb") as f:
+        assert f.read() == b"png"
+    assert context["download_timings"] == {"bundle": 0.2}
+    assert sorted(os.listdir(tmp_path)) == [
+        "albedo.png",
+        "final_rubber_duck.mtl",
+        "final_rubber_duck.obj",
+    ]
+
+
+def test_adventure_busy():
+    """Test that stories beyond the generation limit are refused"""
+    wrapper = Wrapper(cache_system_prompt=False)
+
+    with patch.object(wrapper.llm, "generate", return_value=None):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/adventure", json={"user_prompt": "Aria"}
+            )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_adventure_streams_coalesced_text():
+    """Test that story tokens are streamed as SSE text frames"""
+    wrapper = Wrapper(sse_coalesce_window=60, cache_system_prompt=False)
+    stream = MagicMock()
+    stream.__iter__.return_value = iter(
+        [
+            b'{"model":"mistral","response":"Aria","done":false}',
+            b'{"model":"mistral","response":" wakes","done":false}',
+            b'{"model":"mistral","response":"","done":true}',
+        ]
+    )
+
+    with patch.object(wrapper.llm, "generate", return_value=stream):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/adventure", json={"user_prompt": "Aria"}
+            )
+            assert response.get_data() == b'data: {"text": "Aria wakes"}\n\n'
+            # WSGI servers close the response, also when the client is gone
+            response.close()
+
+    stream.close.assert_called_once()
+
+
+def test_system_prompt_context_reuse():
+    """Test that the primed context replaces the system prompt"""
+    wrapper = Wrapper()
+
+    with patch.object(wrapper.llm_contexts, "get", return_value=[1, 2]):
+        assert wrapper.system_prompt_fields("Be brief.") == {"context": [1, 2]}
+
+    with patch.object(wrapper.llm_contexts, "get", return_value=None):
+        assert wrapper.system_prompt_fields("Be brief.") == {
+            "system": "Be brief."
+        }
+
+
+def test_adventure_session_continuation():
+    """Test that follow-up turns only send the new prompt and context"""
+    wrapper = Wrapper(cache_system_prompt=False, session_max_tokens=100)
+    payloads = []
+
+    def generate(payload):
+        payloads.append(payload)
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(
+            [
+                b'{"response":"The end.","done":false}',
+                b'{"response":"","done":true,"context":[1, 2, 3]}',
+            ]
+        )
+        return stream
+
+    with patch.object(wrapper.llm, "generate", side_effect=generate):
+        with wrapper.app.test_client() as client:
+            response = client.post(
+                "/api/adventure", json={"user_prompt": "Aria"}
+            )
+            response.get_data()
+            session_id = response.headers["X-Session-Id"]
+
+            response = client.post(
+                "/api/adventure",
+                json={"user_prompt": "Go north", "session_id": session_id},
+            )
+            response.get_data()
+
+            # Beyond the token budget the history is resent as a transcript
+            wrapper.sessions.get(session_id).context = list(range(200))
+            response = client.post(
+                "/api/adventure",
+                json={"user_prompt": "Go south", "session_id": session_id},
+            )
+            response.get_data()
+
+            response = client.post(
+                "/api/adventure",
+                json={"user_prompt": "Go", "session_id": "f" * 32},
+            )
+            assert response.status_code == 404
+
+    assert "system" in payloads[0]
+    assert payloads[1] == {
+        "model": "mistral",
+        "prompt": "Go north",
+        "context": [1, 2, 3],
+    }
+    assert "system" in payloads[2] and "context" not in payloads[2]
+    assert payloads[2]["prompt"].endswith(
+        "Assistant: The end.\n\nHuman: Go south"
+    )
+
+
+def test_adventure_cache_replays_story(tmp_path):
+    """Test that a repeated new story is replayed without the LLM"""
+    wrapper = Wrapper(
+        cache_system_prompt=False,
+        sse_coalesce_window=0,
+        adventure_cache_dir=str(tmp_path),
+        adventure_replay_speed=0,
+    )
+
+    def generate(payload):
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(
+            [
+                b'{"response":"Aria","done":false}',
+                b'{"response":" wakes","done":false}',
+                b'{"response":"","done":true,"context":[1, 2]}',
+            ]
+        )
+        return stream
+
+    with patch.object(
+        wrapper.llm, "generate", side_effect=generate
+    ) as mock_generate:
+        with wrapper.app.test_client() as client:
+            first = client.post("/api/adventure", json={"user_prompt": "Aria"})
+            story = first.get_data()
+
+            second = client.post("/api/adventure", json={"user_prompt": "Aria"})
+            assert second.get_data() == story
+            session = wrapper.sessions.get(second.headers["X-Session-Id"])
+            assert session.context == [1, 2]
+            assert session.turns[0]["assistant"] == "Aria wakes"
+
+            # Other sampling options are a different story
+            response = client.post(
+                "/api/adventure",
+                json={"user_prompt": "Aria", "options": {"seed": 7}},
+            )
+            response.get_data()
+            assert mock_generate.call_args[0][0]["options"] == {"seed": 7}
+
+    assert mock_generate.call_count == 2
+    assert first.headers["X-Session-Id"] != second.headers["X-Session-Id"]